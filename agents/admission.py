@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from agents.planner import FIRST_STEP
+
+# Priority classes, lower ranks get planner slots first and are shed last
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class RateLimited(Exception):
+    """Raised when a tenant is over its request rate"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per key, refilled at `rate` requests per second up to `burst`; least recently seen keys are forgotten.
+    A request costing more than `burst` (a large batch) is let through once the bucket is full and leaves it in debt,
+    so the key's next requests wait until its whole cost has been paid back at `rate`.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, cost: float = 1) -> float:
+        """0 when the request may go ahead, otherwise the seconds until it would"""
+        needed = min(cost, self.burst)  # a batch bigger than the burst could never fit, it needs a full bucket instead
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= needed:
+                tokens -= cost  # the full cost, the bucket goes negative for a large batch
+            else:
+                wait = (needed - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class AdmissionController:
+    """
+    Decides, before a plan request reaches the planner executor, whether it is admitted and with which priority.
+    Tenants (X-Tenant-ID, or X-Agent-ID) over their rate are rejected, requests without either are not limited.
+    Priority comes from the X-Priority header, otherwise a request whose last step is one of `priority_actions`
+    is high (the user is answering a pending swap or transfer), and `default` applies to the rest.
+    The deadline is X-Deadline-Ms after the request arrived, or `default_timeout` seconds when it is not sent.
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 0, priority_actions=(), default_timeout: float = 0):
+        self.limiter = RateLimiter(rate, burst or max(rate, 1)) if rate > 0 else None
+        self.priority_actions = frozenset(priority_actions)
+        self.default_timeout = default_timeout
+        self.admitted = Counter()
+        self.rate_limited = 0
+
+    def admit(self, tenant: str | None, cost: float = 1):
+        if self.limiter is None or tenant is None:
+            return
+        wait = self.limiter.acquire(tenant, cost)
+        if wait > 0:
+            self.rate_limited += 1
+            raise RateLimited(f"rate limit exceeded for tenant {tenant}", retry_after=wait)
+
+    def classify(self, header: str | None, planner_kind, inputs, default: str = "normal") -> int:
+        """Priority rank of a prepared plan request"""
+        priority = header.strip().lower() if header else None
+        if priority not in PRIORITIES:
+            priority = default
+            last_step = inputs.get("last_step") or (inputs.get("past_steps") or [None])[-1]
+            if planner_kind != FIRST_STEP and last_step is not None and last_step.action in self.priority_actions:
+                priority = "high"
+        self.admitted[priority] += 1
+        return PRIORITIES[priority]
+
+    def deadline(self, header_ms: str | None, received_at: float) -> float | None:
+        """time.perf_counter() value after which the client no longer waits for the answer"""
+        if header_ms:
+            try:
+                return received_at + max(float(header_ms), 0) / 1000
+            except ValueError:
+                pass
+        if self.default_timeout > 0:
+            return received_at + self.default_timeout
+        return None
+
+    def stats(self):
+        return {
+            "rate_limit_rps": self.limiter.rate if self.limiter is not None else None,
+            "admitted": dict(self.admitted),
+            "rate_limited": self.rate_limited,
+        }
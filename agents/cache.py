@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from pydantic import BaseModel
+
+
+def normalize(value):
+    """Canonical form of prompt inputs: models dumped, dict keys sorted, whitespace collapsed"""
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def cache_key(*parts) -> str:
+    payload = json.dumps(normalize(list(parts)), separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DiskStore:
+    """Optional sqlite backing store so cached entries survive restarts and are shared by workers on one host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connect()
+        # a sqlite connection must not be shared across fork, worker processes forked by serve.py reconnect
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0]), row[1]
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+
+
+class PlanCache:
+    """
+    LRU + TTL cache of plan decisions, bounded by the approximate serialized size of its entries.
+    Decisions whose action is in `bypass_actions` are never stored, so side-effecting actions always reach the LM.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300, bypass_actions=(), path: str | None = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bypass_actions = frozenset(bypass_actions)
+        self.disk = DiskStore(path) if path else None
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.time():
+            self._drop(key)
+            entry = None
+        if entry is None and self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None:
+                value, expires_at = stored
+                self._store(key, value, expires_at)
+                entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key, value: dict):
+        if value.get("action") in self.bypass_actions:
+            self.bypassed += 1
+            return
+        expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.put(key, value, expires_at)
+
+    def _store(self, key, value, expires_at):
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter
+
+import dspy
+from loguru import logger
+
+
+class ModelCascade:
+    """
+    Plan with a small model first and escalate to the main LM only when the small model's plan fails a check:
+    the action must be in the catalog and its parameters must validate, and with `samples` > 1 repeated samples
+    at a higher temperature must agree. Only planner kinds in `kinds` are cascaded.
+    Latency saved is estimated against the running average latency of the main LM for the same planner kind,
+    or for all kinds until that kind has been planned by the main LM, fed by escalations and by every other main LM call.
+    """
+
+    def __init__(self, lm: dspy.BaseLM, kinds=(), samples: int = 1):
+        self.lm = lm
+        self.kinds = frozenset(kinds)
+        self.samples = samples
+        self.accepted = Counter()
+        self.escalated = Counter()
+        self.reasons = Counter()
+        self.main_latency = {}  # planner kind, None for all kinds -> moving average seconds of the main LM
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def applies(self, kind) -> bool:
+        return kind in self.kinds
+
+    def observe_main(self, kind, seconds: float):
+        with self._lock:
+            for key in (kind, None):
+                average = self.main_latency.get(key)
+                self.main_latency[key] = seconds if average is None else 0.9 * average + 0.1 * seconds
+
+    def plan(self, kind, program, inputs, check, config=None):
+        """Prediction for the inputs, from the small model when its plan passes `check`, runs on a planner thread"""
+        config = config or {}
+        start = time.perf_counter()
+        reason, detail = self._try_small(program, inputs, check, config)
+        small_seconds = time.perf_counter() - start
+        if reason is None:
+            with self._lock:
+                self.accepted[kind] += 1
+                main_seconds = self.main_latency.get(kind, self.main_latency.get(None))
+                if main_seconds is not None:
+                    self.saved_seconds += main_seconds - small_seconds
+            return detail, "small"
+
+        with self._lock:
+            self.escalated[kind] += 1
+            self.reasons[reason] += 1
+            self.saved_seconds -= small_seconds
+        logger.info(f"cascade escalation ({kind}, {reason}): {detail}")
+        start = time.perf_counter()
+        prediction = program(**inputs, config=config)
+        self.observe_main(kind, time.perf_counter() - start)
+        return prediction, "main"
+
+    def _try_small(self, program, inputs, check, config):
+        """(None, prediction) when the small model plan is accepted, (reason, detail) otherwise"""
+        with dspy.context(lm=self.lm):
+            try:
+                prediction = program(**inputs, config=config)
+            except Exception as e:
+                return "small_model_error", str(e)
+            problem = check(prediction)
+            if problem is not None:
+                return "invalid_plan", problem
+            for rollout in range(1, self.samples):
+                try:
+                    sample = program(**inputs, config={**config, "rollout_id": rollout, "temperature": 1.0})
+                except Exception as e:
+                    return "small_model_error", str(e)
+                if sample.action != prediction.action or sample.parameters != prediction.parameters:
+                    return "samples_disagree", f"{prediction.action} {prediction.parameters} vs {sample.action} {sample.parameters}"
+        return None, prediction
+
+    def stats(self):
+        total = sum(self.accepted.values()) + sum(self.escalated.values())
+        return {
+            "model": self.lm.model,
+            "kinds": sorted(self.kinds),
+            "accepted": dict(self.accepted),
+            "escalated": dict(self.escalated),
+            "escalation_reasons": dict(self.reasons),
+            "escalation_rate": sum(self.escalated.values()) / total if total else 0.0,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+        }
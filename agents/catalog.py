@@ -0,0 +1,186 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from agents.action import ACTION_LIST
+
+WRAP_UP_ACTION = {"name": "WRAP_UP",
+            "strict": True,
+            "additionalProperties": False,
+            "description": """Wrap up the process for previous steps when the user's request is completely executed or it is unable to be completed.
+# Guideline
+1. Generate a message to the user utilizing the information from previous steps.""",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "message": {
+                        "type": "string",
+                        "description": "The message to wrap up the process or to reply to the user's message"
+                    }}}}
+
+GENERAL_CHAT_ACTION = {"name": "GENERAL_CHAT",
+            "strict": True,
+            "additionalProperties": False,
+            "description": """Reply to the user's message. This action is triggered when the user's message is not related to the crypto market.""",
+            "parameters": {
+                "type": "object",
+                "properties": {"message": {"type": "string", "description": "The message to reply to the user"}}}}
+
+SWITCH_TASK_ACTION = {"name": "SWITCH_TASK",
+            "strict": True,
+            "additionalProperties": False,
+            "description": """Generate a new task definition. This action is triggered when the current task definition does not match the user's latest message.""",
+            "parameters": {
+                "type": "object",
+                "properties": {"newTaskDefinition": {"type": "string", "description": "new task definition"}}}}
+
+
+# Keys sent to the LM for each action, the OpenAI function-calling flags carry no meaning in the prompt
+PROMPT_KEYS = ("name", "description", "parameters")
+
+# Actions the LM knows under a different name, mapped back after planning
+PROMPT_ALIASES = {"CREATE_TOKEN": "LAUNCH_TOKEN"}
+RESPONSE_ALIASES = {alias: name for name, alias in PROMPT_ALIASES.items()}
+
+DEFAULT_CATALOG_ID = "default"
+
+
+def catalog_id(actions) -> str:
+    payload = json.dumps(actions, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_actions(actions) -> str:
+    """Compact prompt rendering of an action list, one numbered JSON object per line"""
+    return "\n".join(
+        f"[{idx + 1}] {json.dumps(action, separators=(',', ':'), ensure_ascii=False)}"
+        for idx, action in enumerate(actions)
+    )
+
+
+def sort_keys(value):
+    """Same JSON value with every object's keys sorted, so equal schemas render to the same prompt text"""
+    if isinstance(value, dict):
+        return {key: sort_keys(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [sort_keys(item) for item in value]
+    return value
+
+
+def strip_titles(schema):
+    """Drop the pydantic generated titles from a JSON schema, property names are kept"""
+    if isinstance(schema, list):
+        return [strip_titles(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    compact = {}
+    for key, value in schema.items():
+        if key == "title" and isinstance(value, str):
+            continue
+        if key == "properties" and isinstance(value, dict):
+            compact[key] = {name: strip_titles(prop) for name, prop in value.items()}
+        else:
+            compact[key] = strip_titles(value)
+    return compact
+
+
+def from_function_schema(tool) -> dict:
+    """Convert an agents.action function-calling schema to the action format clients send in /plan"""
+    function = tool["function"]
+    parameters = strip_titles(function["parameters"])
+    parameters.pop("description", None)  # same text as the action description
+    return {
+        "name": function["name"],
+        "strict": True,
+        "additionalProperties": False,
+        "description": function["description"],
+        "parameters": parameters,
+    }
+
+
+class ActionCatalog:
+    """
+    A registered action list with its prompt renderings prepared once.
+    With `canonical`, action parameters are rendered with sorted keys, so the same catalog gives the same prompt
+    in every worker whatever key order its first client used.
+    """
+
+    def __init__(self, id: str, actions: list[dict], canonical: bool = False):
+        self.id = id
+        self.actions = actions
+        self.names = frozenset(action["name"] for action in actions)
+        self.validators = {}  # action name -> compiled parameter validator, filled by agents.validation
+
+        prompt_actions = [
+            {key: sort_keys(action[key]) if canonical else action[key] for key in PROMPT_KEYS if key in action}
+            for action in actions
+        ]
+        for action in prompt_actions:
+            action["name"] = PROMPT_ALIASES.get(action["name"], action["name"])
+        for extra in (WRAP_UP_ACTION, GENERAL_CHAT_ACTION):
+            if extra["name"] not in self.names:
+                prompt_actions.append({key: extra[key] for key in PROMPT_KEYS})
+        self.prompt = render_actions(prompt_actions)
+        self.prompt_with_switch_task = render_actions(
+            prompt_actions + [{key: SWITCH_TASK_ACTION[key] for key in PROMPT_KEYS}]
+        )
+
+
+class CatalogRegistry:
+    """
+    Action catalogs deduplicated by content hash, so clients can register their actions once and send a catalog_id.
+    Inline action lists go through the registry as well, which keeps their prompt rendering cached, but in a
+    separate LRU so that heavy inline traffic cannot evict registered catalogs.
+    Least recently used catalogs are evicted beyond `max_entries` (registered) and `max_inline_entries` (inline),
+    the default catalog is never evicted.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_actions=None, canonical: bool = False, max_inline_entries: int = 1024):
+        self.max_entries = max_entries
+        self.max_inline_entries = max_inline_entries
+        self.canonical = canonical
+        self._catalogs = OrderedDict()  # registered with POST /catalogs
+        self._inline = OrderedDict()  # sent with a plan request
+        actions = default_actions if default_actions is not None else [from_function_schema(tool) for tool in ACTION_LIST]
+        self.default = ActionCatalog(DEFAULT_CATALOG_ID, actions, canonical)
+
+    def register(self, actions, inline: bool = False) -> ActionCatalog:
+        actions = [action for action in actions if action is not None]
+        if not all(isinstance(action, dict) and action.get("name") for action in actions):
+            raise ValueError("every action needs a name")
+        id = catalog_id(actions)
+        catalog = self._catalogs.get(id)
+        if catalog is not None:
+            self._catalogs.move_to_end(id)
+            return catalog
+        if inline:
+            store, max_entries = self._inline, self.max_inline_entries
+            catalog = store.get(id)
+        else:
+            store, max_entries = self._catalogs, self.max_entries
+            catalog = self._inline.pop(id, None)  # registering a catalog already sent inline keeps its rendering
+        if catalog is None:
+            catalog = ActionCatalog(id, actions, self.canonical)
+        store[id] = catalog
+        store.move_to_end(id)
+        while len(store) > max_entries:
+            store.popitem(last=False)
+        return catalog
+
+    def get(self, id: str) -> ActionCatalog | None:
+        if id == DEFAULT_CATALOG_ID:
+            return self.default
+        for store in (self._catalogs, self._inline):
+            catalog = store.get(id)
+            if catalog is not None:
+                store.move_to_end(id)
+                return catalog
+        return None
+
+    def stats(self):
+        return {
+            "catalogs": len(self._catalogs),
+            "max_entries": self.max_entries,
+            "inline_catalogs": len(self._inline),
+            "max_inline_entries": self.max_inline_entries,
+        }
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical requests: while a call for a key is running, callers with the same key
+    await it instead of starting their own, and for `window` seconds after it succeeded they get its result.
+    Failures are shared with the callers already waiting but not kept, so a later retry runs again.
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._in_flight = {}  # key -> task
+        self._recent = OrderedDict()  # key -> (expires_at, result), in completion order
+        self.leaders = 0
+        self.coalesced = 0
+        self.late = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._recent and next(iter(self._recent.values()))[0] < now:
+            self._recent.popitem(last=False)
+
+    async def run(self, key, factory, timeout: float | None = None):
+        """
+        (result, shared) of factory() for the key, shared is True when another caller's call answered.
+        Each caller waits at most its own `timeout` (TimeoutError), the call goes on for the others.
+        """
+        self._expire()
+        recent = self._recent.get(key)
+        if recent is not None:
+            self.late += 1
+            return recent[1], True
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shielded so a caller going away does not cancel the call the others wait on
+            return await asyncio.wait_for(asyncio.shield(task), timeout), True
+
+        self.leaders += 1
+        task = asyncio.ensure_future(factory())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.wait_for(asyncio.shield(task), timeout), False
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+        if self.window > 0 and not task.cancelled() and task.exception() is None:
+            self._recent.pop(key, None)
+            self._recent[key] = (time.monotonic() + self.window, task.result())
+
+    def stats(self):
+        return {
+            "window_seconds": self.window,
+            "in_flight": len(self._in_flight),
+            "recent": len(self._recent),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "late": self.late,
+        }
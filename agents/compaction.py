@@ -0,0 +1,151 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+from pydantic import BaseModel
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character estimate when tiktoken is not installed
+    tiktoken = None
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o"):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # the encoding file is downloaded on first use, which fails offline
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens from characters: {e}")
+        return None
+
+
+# LRU of token counts keyed by a digest of the text, so long step results are not kept alive by the cache
+TOKEN_COUNT_CACHE_SIZE = 65536
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+    with _token_counts_lock:
+        tokens = _token_counts.get(key)
+        if tokens is not None:
+            _token_counts.move_to_end(key)
+            return tokens
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    with _token_counts_lock:
+        _token_counts[key] = tokens
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return tokens
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        kept = text[: max_tokens * 4]
+    else:
+        kept = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return f"{kept} ...[truncated {total - max_tokens} tokens]"
+
+
+def render_message(msg) -> str:
+    line = f"{msg.role}: {msg.content}"
+    if msg.attachments:
+        line += f" (Attachment: {msg.attachments[0].url})"
+    return line + "\n"
+
+
+def step_tokens(step) -> int:
+    return count_tokens(step.action) + count_tokens(step.detail) + count_tokens(step.result)
+
+
+class PromptBudget(BaseModel):
+    """Token budget for the chat history and past steps of one planner signature, 0 disables compaction"""
+
+    max_tokens: int = 0
+    keep_recent_turns: int = 4
+    keep_recent_steps: int = 2
+    turn_max_tokens: int = 200
+    step_result_max_tokens: int = 300
+
+
+class PromptCompactor:
+    """
+    Fit chat history and past steps into the budget of a planner kind.
+    The most recent turns and steps are always kept verbatim. Older content is reduced in order:
+    older step results are truncated, older turns are truncated, the oldest turns are dropped,
+    and finally older step results are removed, stopping as soon as the prompt fits.
+    """
+
+    def __init__(self, budgets: dict[str, PromptBudget]):
+        self.budgets = budgets
+        self.trimmed_tokens = 0
+
+    def compact(self, kind, history_lines: list[str], past_steps: list):
+        budget = self.budgets.get(kind)
+        if budget is None or budget.max_tokens <= 0:
+            return history_lines, past_steps, 0
+
+        line_tokens = [count_tokens(line) for line in history_lines]
+        steps = list(past_steps)
+        steps_tokens = [step_tokens(step) for step in steps]
+        before = sum(line_tokens) + sum(steps_tokens)
+        if before <= budget.max_tokens:
+            return history_lines, past_steps, 0
+
+        lines = list(history_lines)
+        old_lines = max(len(lines) - budget.keep_recent_turns, 0)
+        old_steps = max(len(steps) - budget.keep_recent_steps, 0)
+
+        def total():
+            return sum(line_tokens) + sum(steps_tokens)
+
+        def shrink_steps(max_tokens):
+            for i in range(old_steps):
+                if total() <= budget.max_tokens:
+                    return
+                result = truncate_tokens(steps[i].result, max_tokens) if max_tokens else "[result omitted]"
+                if result != steps[i].result:
+                    steps[i] = steps[i].model_copy(update={"result": result})
+                    steps_tokens[i] = step_tokens(steps[i])
+
+        shrink_steps(budget.step_result_max_tokens)
+
+        for i in range(old_lines):
+            if total() <= budget.max_tokens:
+                break
+            truncated = truncate_tokens(lines[i].rstrip("\n"), budget.turn_max_tokens) + "\n"
+            if truncated != lines[i]:
+                lines[i] = truncated
+                line_tokens[i] = count_tokens(truncated)
+
+        dropped = 0
+        while dropped < old_lines and total() > budget.max_tokens:
+            line_tokens[dropped] = 0
+            dropped += 1
+        if dropped:
+            marker = f"[{dropped} earlier messages omitted]\n"
+            lines = [marker] + lines[dropped:]
+            line_tokens = [count_tokens(marker)] + line_tokens[dropped:]
+
+        shrink_steps(0)
+
+        after = total()
+        trimmed = before - after
+        self.trimmed_tokens += trimmed
+        logger.info(f"prompt compaction ({kind}): trimmed {trimmed} tokens, {before} -> {after}, budget {budget.max_tokens}")
+        return lines, steps, trimmed
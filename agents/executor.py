@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PlannerSaturated(Exception):
+    """Raised when every planner slot is busy and the wait queue is full"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes while it waits for a planner slot or for the LM"""
+
+
+class PlannerExecutor:
+    """
+    Run blocking dspy planner calls on a dedicated thread pool so the event loop stays free.
+    At most `max_concurrency` calls run at once, at most `max_queue` callers wait for a slot,
+    anything beyond that is rejected with PlannerSaturated.
+    Waiting callers get free slots by priority (lower first), then in arrival order. When the queue is full,
+    the newest waiter of the lowest priority below the arriving caller's is shed to make room for it.
+    Callers with a deadline (a time.perf_counter() value) stop waiting with DeadlineExceeded when it passes.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="planner")
+        self._waiters = []  # heap of (priority, seq, future), futures already done are skipped
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.shed = 0
+        self.expired = 0
+
+    async def acquire(self, priority: int = 1, deadline: float | None = None):
+        """Take a planner slot, waiting in the queue if needed; pair every call with release()"""
+        if deadline is not None and time.perf_counter() >= deadline:
+            self.expired += 1
+            raise DeadlineExceeded("deadline exceeded before planning")
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            return
+
+        if self.queued >= self.max_queue:
+            live = [waiter for waiter in self._waiters if not waiter[2].done()]
+            victim = max(live, key=lambda waiter: (waiter[0], waiter[1]), default=None)
+            if victim is None or victim[0] <= priority:
+                self.rejected += 1
+                raise PlannerSaturated(
+                    f"planner saturated: {self.in_flight} in flight, {self.queued} queued"
+                )
+            victim[2].set_exception(PlannerSaturated("planner saturated: shed for a higher priority request"))
+            self.queued -= 1
+            self.shed += 1
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.queued += 1
+        timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()  # the slot arrived as the deadline passed
+            else:
+                future.cancel()
+                self.queued -= 1
+            self.expired += 1
+            raise DeadlineExceeded("deadline exceeded while waiting for a planner slot")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            elif not future.done():
+                future.cancel()
+                self.queued -= 1
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # hand the slot over, in_flight stays the same
+                self.queued -= 1
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def run(self, fn, *args, priority: int = 1, deadline: float | None = None, **kwargs):
+        await self.acquire(priority, deadline)
+        loop = asyncio.get_running_loop()
+        # copy the context so dspy.context() overrides made by the caller reach the worker thread
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        future = self._pool.submit(call)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+        timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # the thread keeps its slot until the call returns, the LM request itself is bounded by the deadline
+            self.expired += 1
+            raise DeadlineExceeded("deadline exceeded while planning")
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "expired": self.expired,
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,298 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import dspy
+from loguru import logger
+from pydantic import BaseModel
+
+
+class LMUnavailable(Exception):
+    """Raised when every endpoint of the pool failed or has its circuit open"""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LMEndpointConfig(BaseModel):
+    """One entry of LM_POOL, the api key is given directly or by the name of the env var holding it"""
+
+    model: str
+    api_base: str | None = None
+    api_key: str | None = None
+    api_key_env: str | None = None
+    timeout: float = 30
+    num_retries: int = 0  # the pool fails over to the next endpoint instead of retrying
+    cache: bool = True
+    kwargs: dict = {}
+
+
+def quantile(samples, q: float):
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def is_valid(response) -> bool:
+    """A response worth returning: it has a choice with text or tool calls"""
+    try:
+        message = response.choices[0].message
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return False
+    return bool(getattr(message, "content", None) or getattr(message, "tool_calls", None))
+
+
+class LMEndpoint:
+    """
+    One upstream LM with a rolling latency window and a circuit breaker.
+    The circuit opens after `failure_threshold` consecutive failures and lets a single probe request through
+    after `cooldown` seconds; a failure then reopens it, a success closes it.
+    """
+
+    def __init__(self, lm: dspy.BaseLM, name: str, window: int = 200, failure_threshold: int = 5, cooldown: float = 30):
+        self.lm = lm
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False  # the half-open probe request is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def try_acquire(self) -> bool:
+        """Whether a request may be sent now, False when the endpoint is half open and its probe is in flight"""
+        with self._lock:
+            if self.state != "half_open":
+                return True
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def abandon(self):
+        """The request went away without an outcome (cancelled), let the next one probe the half-open endpoint"""
+        with self._lock:
+            self.probing = False
+
+    def reopens_in(self) -> float:
+        """Seconds until an open circuit lets a probe through, 0 when it already does"""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def p50(self) -> float:
+        with self._lock:
+            return quantile(self.latencies, 0.5) if self.latencies else 0.0
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None or self.state == "half_open":
+                    logger.warning(f"LM endpoint {self.name}: circuit open after {self.consecutive_failures} failures")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self.latencies)
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(quantile(latencies, 0.5) * 1000, 1) if latencies else None,
+            "p95_ms": round(quantile(latencies, 0.95) * 1000, 1) if latencies else None,
+        }
+
+
+class LMPool(dspy.BaseLM):
+    """
+    Pool of LM endpoints used as a single dspy LM.
+    Requests go to the available endpoint with the lowest median latency and fail over to the next one on error.
+    While every circuit is open they fail right away with LMUnavailable instead of reaching a dead upstream.
+    With hedging, a second request goes to the next endpoint when the first has not answered within
+    the `hedge_quantile` latency of its endpoint (clamped to [hedge_min_delay, hedge_max_delay]),
+    and the first valid answer wins. Streamed calls fail over but are not hedged.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[LMEndpoint],
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+        hedge_max_delay: float = 2.0,
+        max_workers: int = 64,
+    ):
+        if not endpoints:
+            raise ValueError("LMPool needs at least one endpoint")
+        super().__init__(model=endpoints[0].lm.model, cache=False)
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        # hedged calls run here so the calling planner thread can wait on both
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lm-pool")
+
+    @classmethod
+    def from_config(cls, configs: list[LMEndpointConfig], failure_threshold: int = 5, cooldown: float = 30, **kwargs):
+        endpoints = []
+        for config in configs:
+            api_key = config.api_key or (os.getenv(config.api_key_env) if config.api_key_env else None)
+            lm = dspy.LM(
+                model=config.model,
+                api_base=config.api_base,
+                api_key=api_key,
+                timeout=config.timeout,
+                num_retries=config.num_retries,
+                cache=config.cache,
+                **config.kwargs,
+            )
+            name = f"{config.model}@{config.api_base}" if config.api_base else config.model
+            endpoints.append(LMEndpoint(lm, name, failure_threshold=failure_threshold, cooldown=cooldown))
+        return cls(endpoints, **kwargs)
+
+    def ranked(self) -> list[LMEndpoint]:
+        """Available endpoints fastest first, see try_acquire before sending; LMUnavailable right away when there is none"""
+        available = sorted((e for e in self.endpoints if e.available()), key=lambda e: e.p50())
+        if not available:
+            retry_after = min(endpoint.reopens_in() for endpoint in self.endpoints)
+            raise LMUnavailable("every LM endpoint has its circuit open", retry_after=max(retry_after, 1))
+        return available
+
+    def hedge_delay(self, endpoint: LMEndpoint) -> float:
+        with endpoint._lock:
+            latencies = list(endpoint.latencies)
+        if len(latencies) < 20:
+            return self.hedge_max_delay
+        return min(max(quantile(latencies, self.hedge_quantile), self.hedge_min_delay), self.hedge_max_delay)
+
+    def _call(self, endpoint: LMEndpoint, prompt, messages, kwargs):
+        start = time.perf_counter()
+        try:
+            response = endpoint.lm.forward(prompt=prompt, messages=messages, **kwargs)
+        except Exception:
+            endpoint.record_failure()
+            raise
+        if not is_valid(response):
+            endpoint.record_failure()
+            raise ValueError(f"LM endpoint {endpoint.name} returned an empty response")
+        endpoint.record_success(time.perf_counter() - start)
+        return response
+
+    def _submit(self, endpoint, prompt, messages, kwargs):
+        call = contextvars.copy_context().run
+        return self._pool.submit(call, self._call, endpoint, prompt, messages, kwargs)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        endpoints = self.ranked()
+        last_error = None
+        pending = {}
+        next_index = 0
+
+        def launch() -> bool:
+            nonlocal next_index
+            while next_index < len(endpoints):
+                endpoint = endpoints[next_index]
+                next_index += 1
+                if endpoint.try_acquire():
+                    pending[self._submit(endpoint, prompt, messages, kwargs)] = endpoint
+                    return True
+            return False
+
+        if not launch():
+            raise LMUnavailable("every LM endpoint is half open with a probe request in flight", retry_after=1)
+        first = next(iter(pending))
+        while pending:
+            timeout = None
+            if self.hedge and next_index < len(endpoints) and len(pending) == 1 and first in pending:
+                timeout = self.hedge_delay(pending[first])
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    self.hedges += 1
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"LM endpoint {endpoint.name} failed: {e}")
+                    continue
+                if future is not first:
+                    self.hedge_wins += 1
+                return response
+            if not pending and launch():
+                self.failovers += 1
+        raise LMUnavailable(f"all LM endpoints failed: {last_error}")
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        last_error = None
+        attempts = 0
+        for endpoint in self.ranked():
+            if not endpoint.try_acquire():
+                continue
+            if attempts:
+                self.failovers += 1
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                response = await endpoint.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+                if not is_valid(response):
+                    raise ValueError(f"LM endpoint {endpoint.name} returned an empty response")
+            except Exception as e:
+                endpoint.record_failure()
+                last_error = e
+                logger.warning(f"LM endpoint {endpoint.name} failed: {e}")
+                continue
+            except BaseException:
+                # cancelled, e.g. the stream client disconnected, a half-open probe must not stay in flight forever
+                endpoint.abandon()
+                raise
+            endpoint.record_success(time.perf_counter() - start)
+            return response
+        if not attempts:
+            raise LMUnavailable("every LM endpoint is half open with a probe request in flight", retry_after=1)
+        raise LMUnavailable(f"all LM endpoints failed: {last_error}")
+
+    def stats(self):
+        return {
+            "hedge": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "endpoints": {endpoint.name: endpoint.stats() for endpoint in self.endpoints},
+        }
@@ -0,0 +1,219 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from dspy.utils.callback import BaseCallback
+
+# (chain, planner kind) of the plan being run, read by StageTimer inside the dspy call
+stage_labels = contextvars.ContextVar("stage_labels", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """One metric family in the Prometheus text format, values are keyed by label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                # per bucket counts, then +Inf, then the sum
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = [(labelvalues, list(counts)) for labelvalues, counts in self._values.items()]
+        for labelvalues, counts in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, labelvalues, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_stats(prefix: str, stats: dict | None) -> list[str]:
+    """Numeric values of a stats() dict as gauges, nested dicts of numbers get a `key` label"""
+    lines = []
+    for name, value in (stats or {}).items():
+        metric = f"{prefix}_{name}"
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, (int, float)):
+            lines += [f"# TYPE {metric} gauge", f"{metric} {format_value(value)}"]
+        elif isinstance(value, dict) and all(isinstance(item, (int, float)) for item in value.values()):
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [f'{metric}{{key="{escape(key)}"}} {format_value(item)}' for key, item in value.items()]
+    return lines
+
+
+class PlanMetrics:
+    """Metrics of the planning endpoints, rendered by GET /metrics"""
+
+    def __init__(self, prefix: str = "agent_router"):
+        self.prefix = prefix
+        self.stage_seconds = Histogram(
+            f"{prefix}_plan_stage_seconds",
+            "Time spent in each planning stage",
+            ("stage", "chain", "planner_kind"),
+        )
+        self.lm_tokens = Histogram(
+            f"{prefix}_lm_tokens",
+            "Prompt, cached prompt and completion tokens per planner LM call",
+            ("type", "chain", "planner_kind"),
+            buckets=TOKEN_BUCKETS,
+        )
+        self.actions = Counter(f"{prefix}_plan_actions_total", "Planned actions by where the decision came from", ("action", "source"))
+        self.errors = Counter(f"{prefix}_plan_errors_total", "Failed plan requests", ("endpoint", "status"))
+        self.in_flight = Gauge(f"{prefix}_plan_in_flight", "Plan requests being handled", ("endpoint",))
+
+    def observe_stage(self, stage, seconds, labels=None):
+        labels = labels or stage_labels.get()
+        if labels is not None:
+            self.stage_seconds.observe(seconds, stage, *labels)
+
+    def observe_usage(self, usage: dict | None, labels):
+        """Token counts from Prediction.get_lm_usage(), keyed by LM model"""
+        for model_usage in (usage or {}).values():
+            for kind in ("prompt", "completion"):
+                tokens = model_usage.get(f"{kind}_tokens")
+                if tokens is not None:
+                    self.lm_tokens.observe(tokens, kind, *labels)
+            # prompt tokens served from the upstream prefix cache, reported by OpenAI compatible APIs
+            cached = (model_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached is not None:
+                self.lm_tokens.observe(cached, "cached", *labels)
+
+    def prompt_cache_stats(self):
+        """Prompt and cached prompt tokens so far by planner kind, and the share served from the prefix cache"""
+        prompt, cached = {}, {}
+        with self.lm_tokens._lock:
+            for (kind, _, planner_kind), counts in self.lm_tokens._values.items():
+                if kind == "prompt":
+                    prompt[planner_kind] = prompt.get(planner_kind, 0) + counts[-1]
+                elif kind == "cached":
+                    cached[planner_kind] = cached.get(planner_kind, 0) + counts[-1]
+        return {
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "hit_rate": {kind: cached.get(kind, 0) / tokens for kind, tokens in prompt.items() if tokens},
+        }
+
+    def render(self, stats: dict | None = None) -> str:
+        lines = []
+        for metric in (self.stage_seconds, self.lm_tokens, self.actions, self.errors, self.in_flight):
+            lines += metric.render()
+        for name, value in (stats or {}).items():
+            lines += render_stats(f"{self.prefix}_{name}", value)
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer(BaseCallback):
+    """dspy callback timing prompt formatting, the LM call and output parsing of the current plan"""
+
+    def __init__(self, metrics: PlanMetrics):
+        self.metrics = metrics
+        self._starts = {}
+
+    def _start(self, call_id):
+        self._starts[call_id] = time.perf_counter()
+
+    def _end(self, stage, call_id):
+        start = self._starts.pop(call_id, None)
+        if start is not None:
+            self.metrics.observe_stage(stage, time.perf_counter() - start)
+
+    def on_adapter_format_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_adapter_format_end(self, call_id, outputs, exception=None):
+        self._end("format", call_id)
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        self._end("lm", call_id)
+
+    def on_adapter_parse_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_adapter_parse_end(self, call_id, outputs, exception=None):
+        self._end("output_parse", call_id)
+
+
+class RequestTimer:
+    """ASGI middleware stamping when a request arrived, so handlers can time body parsing and validation"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
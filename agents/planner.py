@@ -1,5 +1,7 @@
 import dspy
-from typing import Any
+from types import MappingProxyType
+from typing import Any, Literal
+from loguru import logger
 
 SOL_BACKGROUND_PROMPT = """
 You are a crypto expert agent in Solana chain, you can help user to analyze crypto tokens and manage their crypto assets.
@@ -48,6 +50,36 @@ class PlannerWithSwitchTask(dspy.Signature):
     )
     action_description = dspy.OutputField(description="Action and parameters in short natural language")
 
+# Same decision as PlannerWithSwitchTask with short flags in place of the reasoning fields that repeat the inputs,
+# so far fewer tokens are generated before the action. benchmarks/switch_task_mode.py compares both on a corpus
+class PlannerWithSwitchTaskLean(dspy.Signature):
+    """
+    # Objective
+    1. Figure out the best action to take based on the user's latest message and the past steps taken.
+    2. If the task definition does not match the user's latest message, generate a new task using "SWITCH_TASK". Otherwise, break the task into smaller steps and plan the next action to take based on the task definition and past steps taken.
+    3. User might repeat the same task multiple times, even if the task is completed, if the user's latest message is to run it again, you should obey the user's instruction.
+
+    # Guideline:
+    1. If the task is completely finished or unable to proceed based on the past steps, wrap up the process and call the action "WRAP_UP".
+    2. Repeat last step if it was pending user's input and the user confirmed it, skip it if the user rejected it
+    3. If the task requires only general response, call the action "GENERAL_CHAT".
+    """
+
+    chat_history = dspy.InputField(description="Chat history")
+    new_message = dspy.InputField(description="Latest message from the user")
+    task_definition = dspy.InputField(description="Task definition")
+    available_action = dspy.InputField(description="List of actions you can take")
+    past_steps = dspy.InputField(description="Past actions taken and their results")
+    last_step = dspy.InputField(description="The most recent step taken and its result")
+    same_task: bool = dspy.OutputField(description="Whether the user's latest message matches the current task definition, if not the action is \"SWITCH_TASK\"")
+    last_step_status: Literal["not_pending", "confirmed", "rejected"] = dspy.OutputField(description="Whether the last step was pending the user's input, and if so whether the user confirmed or rejected it")
+    task_done: bool = dspy.OutputField(description="Whether the past steps fully satisfy the task definition, if so the action is \"WRAP_UP\"")
+    action = dspy.OutputField(description="Action to take")
+    parameters: dict[str, Any] = dspy.OutputField(
+        description="Parameters for the action"
+    )
+    action_description = dspy.OutputField(description="Action and parameters in short natural language")
+
 class PlannerForLoop(dspy.Signature):
     """
     # Objective
@@ -92,4 +124,103 @@ class PlannerForFirstStep(dspy.Signature):
     parameters: dict[str, Any] = dspy.OutputField(
         description="Parameters for the action"
     )
-    action_description = dspy.OutputField(description="Action and parameters in short natural language")
\ No newline at end of file
+    action_description = dspy.OutputField(description="Action and parameters in short natural language")
+
+
+class RepairParameters(dspy.Signature):
+    """
+    Fix the parameters of the chosen action so that they match the action's parameter schema.
+    Only change what the errors point at and keep every value taken from the user's request.
+    Leave out optional parameters that cannot be derived from the request.
+    """
+    request = dspy.InputField(description="The user's latest message or the task definition")
+    action_schema = dspy.InputField(description="Name, description and parameter schema of the chosen action")
+    parameters = dspy.InputField(description="Parameters that failed validation")
+    errors = dspy.InputField(description="Validation errors of the parameters")
+    fixed_parameters: dict[str, Any] = dspy.OutputField(description="Corrected parameters for the action")
+
+
+CHAIN_BACKGROUND_PROMPTS = {
+    "solana": SOL_BACKGROUND_PROMPT,
+    "bsc": BSC_BACKGROUND_PROMPT,
+}
+DEFAULT_CHAIN = "solana"
+
+# Planner kinds, picked per request from switched_task and whether there is a new user message
+FIRST_STEP = "first_step"
+SWITCH_TASK = "switch_task"
+LOOP = "loop"
+
+PLANNER_SIGNATURES = {
+    FIRST_STEP: PlannerForFirstStep,
+    SWITCH_TASK: PlannerWithSwitchTask,
+    LOOP: PlannerForLoop,
+}
+
+# Output modes of the SWITCH_TASK planner: "full" reasons in prose before the action, "lean" answers with flags
+SWITCH_TASK_MODES = {
+    "full": PlannerWithSwitchTask,
+    "lean": PlannerWithSwitchTaskLean,
+}
+
+# Prompt layouts: "default" keeps the field order of the signatures, "prefix_cache" orders the inputs from the most
+# to the least stable, so the upstream prompt cache matches the instructions and the catalog on every call of a
+# planner kind, and the task and the append-only history across the steps of one session
+DEFAULT_LAYOUT = "default"
+PREFIX_CACHE_LAYOUT = "prefix_cache"
+PREFIX_CACHE_INPUT_ORDER = ("available_action", "task_definition", "chat_history", "past_steps", "last_step", "new_message")
+
+
+def prefix_cache_layout(signature):
+    """Copy of the signature with its input fields in PREFIX_CACHE_INPUT_ORDER"""
+    for name in PREFIX_CACHE_INPUT_ORDER:
+        field = signature.input_fields.get(name)
+        if field is not None:
+            signature = signature.delete(name).append(name, field, type_=field.annotation)
+    return signature
+
+
+class PlannerRegistry:
+    """
+    Pre-instantiated planner programs keyed by (chain, planner kind).
+    Each program owns a copy of its signature with the chain background prompt prepended to the instructions,
+    so the shared signature classes are never mutated and concurrent requests on different chains cannot interfere.
+    Adding a chain means adding an entry to CHAIN_BACKGROUND_PROMPTS.
+    The instructions are static per program and rendered into the system message, the `layout` orders the inputs after it.
+    """
+
+    def __init__(
+        self,
+        background_prompts=CHAIN_BACKGROUND_PROMPTS,
+        signatures=PLANNER_SIGNATURES,
+        default_chain=DEFAULT_CHAIN,
+        layout=DEFAULT_LAYOUT,
+        switch_task_mode="full",
+    ):
+        if layout not in (DEFAULT_LAYOUT, PREFIX_CACHE_LAYOUT):
+            raise ValueError(f"Unknown prompt layout: {layout}")
+        if switch_task_mode not in SWITCH_TASK_MODES:
+            raise ValueError(f"Unknown switch task mode: {switch_task_mode}")
+        self.default_chain = default_chain
+        self.layout = layout
+        self.switch_task_mode = switch_task_mode
+        if SWITCH_TASK in signatures:
+            signatures = {**signatures, SWITCH_TASK: SWITCH_TASK_MODES[switch_task_mode]}
+        if layout == PREFIX_CACHE_LAYOUT:
+            signatures = {kind: prefix_cache_layout(signature) for kind, signature in signatures.items()}
+        self._programs = MappingProxyType({
+            (chain, kind): dspy.Predict(signature.with_instructions(f"{background_prompt}{signature.__doc__}"))
+            for chain, background_prompt in background_prompts.items()
+            for kind, signature in signatures.items()
+        })
+
+    @property
+    def chains(self):
+        return sorted({chain for chain, _ in self._programs})
+
+    def get(self, chain, kind):
+        program = self._programs.get((chain, kind))
+        if program is None:
+            logger.warning(f"Invalid chain: {chain}, using {self.default_chain} background prompt")
+            program = self._programs[(self.default_chain, kind)]
+        return program
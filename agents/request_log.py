@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+def digest(value) -> str:
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def cap(value, max_chars: int):
+    """Cap every string in a JSON-like value to `max_chars` characters"""
+    if isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}...[{len(value) - max_chars} chars]"
+    if isinstance(value, dict):
+        return {key: cap(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [cap(item, max_chars) for item in value]
+    return value
+
+
+def compact_payload(payload: dict, max_chars: int) -> dict:
+    """Request payload for the log: the action catalog and attachments are hashed, long strings capped"""
+    payload = dict(payload)
+    actions = payload.get("actions")
+    if actions:
+        payload["actions"] = {
+            "sha256": digest(actions),
+            "names": [action.get("name") for action in actions if isinstance(action, dict)],
+        }
+    history = []
+    for message in payload.get("chat_history") or []:
+        if message.get("attachments"):
+            message = dict(message)
+            message["attachments"] = [
+                {"url": attachment.get("url"), "sha256": digest(attachment)}
+                for attachment in message["attachments"]
+            ]
+        history.append(message)
+    if history:
+        payload["chat_history"] = history
+    return cap(payload, max_chars)
+
+
+class RequestLogger:
+    """
+    Structured request logging kept off the request path.
+    The request thread only enqueues objects; a background thread serializes them and writes to loguru.
+    Every request gets a compact record, full payloads are logged for a `sample_rate` fraction of requests.
+    When the queue is full records are dropped and counted instead of blocking requests.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, max_field_chars: int = 2000, queue_size: int = 10000):
+        self.sample_rate = sample_rate
+        self.max_field_chars = max_field_chars
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._start()
+        # worker processes forked by serve.py need their own queue and writer thread
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = threading.Thread(target=self._drain, name="request-log", daemon=True)
+        self._thread.start()
+
+    def sampled(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def payload(self, request_id: str, request: BaseModel):
+        if self.sampled():
+            self._put(("payload", request_id, request))
+
+    def record(self, request_id: str, **fields):
+        self._put(("record", request_id, fields))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, request_id, value = item
+            try:
+                if kind == "payload":
+                    value = compact_payload(value.model_dump(), self.max_field_chars)
+                logger.info(f"{kind}: {json.dumps({'request_id': request_id, **value}, ensure_ascii=False, default=str)}")
+            except Exception as e:
+                logger.error(f"request log failed: {e}")
+
+    def close(self, timeout: float = 5):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "dropped": self.dropped, "sample_rate": self.sample_rate}
@@ -0,0 +1,179 @@
+import re
+from collections import Counter
+
+from loguru import logger
+from pydantic import ValidationError
+
+from agents.action import ANALYZE_TOKEN, SWAP_TOKEN, WALLET_PORTFOLIO
+from agents.validation import ParameterValidator
+
+SOLANA_ADDRESS = r"[1-9A-HJ-NP-Za-km-z]{32,44}"
+EVM_ADDRESS = r"0x[0-9a-fA-F]{40}"
+ADDRESS = re.compile(rf"^(?:{SOLANA_ADDRESS}|{EVM_ADDRESS})$")
+AMOUNT = r"(?P<amount>\d+(?:\.\d+)?)"
+TOKEN = r"[A-Za-z0-9$_.]{1,44}"
+
+NATIVE_TOKENS = {"solana": "SOL", "bsc": "BNB"}
+
+# Catalog names of the action a rule decides, in order of preference; client catalogs and the prompts call the swap EXECUTE_SWAP
+ACTION_NAMES = {"SWAP_TOKEN": ("SWAP_TOKEN", "EXECUTE_SWAP")}
+
+# Words that fit the token pattern but do not name a token, the LM has to resolve them from context
+NOT_TOKENS = {"token", "tokens", "coin", "coins", "it", "them", "this", "that", "all", "my", "half", "some"}
+
+# Words in a task definition that mean the bare address belongs to another intent, e.g. the token to buy
+OTHER_INTENTS = re.compile(r"\b(buy|sell|swap|send|transfer|launch|create|airdrop|auto|limit|order)\b", re.IGNORECASE)
+
+WALLET_BALANCE = re.compile(
+    r"^(?:(?:check|show|get|what(?:'s| is))\s+)?(?:my\s+)?(?:wallet\s+)?(?:balance|portfolio)(?:\s+please)?\s*\??$",
+    re.IGNORECASE,
+)
+SELL = re.compile(rf"^sell\s+{AMOUNT}\s+(?P<input>{TOKEN})(?:\s+(?:for|to)\s+(?P<output>{TOKEN}))?$", re.IGNORECASE)
+BUY = re.compile(rf"^buy\s+{AMOUNT}\s+(?P<input>{TOKEN})\s+(?:worth\s+)?of\s+(?P<output>{TOKEN})$", re.IGNORECASE)
+BUY_WITH = re.compile(rf"^buy\s+(?P<output>{TOKEN})\s+(?:with|for)\s+{AMOUNT}\s+(?P<input>{TOKEN})$", re.IGNORECASE)
+
+
+def is_token(token: str) -> bool:
+    return token.lower() not in NOT_TOKENS
+
+
+def token_parameters(prefix: str, token: str) -> dict:
+    """inputTokenCA / inputTokenSymbol style parameters for a token given as address or symbol"""
+    if ADDRESS.match(token):
+        return {f"{prefix}TokenCA": token}
+    return {f"{prefix}TokenSymbol": token.lstrip("$").upper()}
+
+
+def analyze_address(message, task_definition, chain):
+    if not ADDRESS.match(message) or OTHER_INTENTS.search(task_definition):
+        return None
+    return ANALYZE_TOKEN, {"tokenAddress": message}, f"Analyze the token {message}"
+
+
+def wallet_balance(message, task_definition, chain):
+    if not WALLET_BALANCE.match(message):
+        return None
+    return WALLET_PORTFOLIO, {"queryType": "walletBalance"}, "Check the wallet balance"
+
+
+def sell(message, task_definition, chain):
+    match = SELL.match(message)
+    if match is None:
+        return None
+    output = match["output"] or NATIVE_TOKENS.get(chain, "SOL")
+    if not (is_token(match["input"]) and is_token(output)) or match["input"].lower() == output.lower():
+        return None
+    parameters = {
+        **token_parameters("input", match["input"]),
+        **token_parameters("output", output),
+        "inputTokenAmount": float(match["amount"]),
+    }
+    return SWAP_TOKEN, parameters, f"Sell {match['amount']} {match['input']} for {output}"
+
+
+def buy(message, task_definition, chain):
+    match = BUY.match(message) or BUY_WITH.match(message)
+    if match is None:
+        return None
+    if not (is_token(match["input"]) and is_token(match["output"])) or match["input"].lower() == match["output"].lower():
+        return None
+    parameters = {
+        **token_parameters("input", match["input"]),
+        **token_parameters("output", match["output"]),
+        "inputTokenAmount": float(match["amount"]),
+    }
+    return SWAP_TOKEN, parameters, f"Buy {match['output']} with {match['amount']} {match['input']}"
+
+
+RULES = {
+    "analyze_address": analyze_address,
+    "wallet_balance": wallet_balance,
+    "sell": sell,
+    "buy": buy,
+}
+
+
+class FastPathRouter:
+    """
+    Rule based pre-planner for unambiguous intents, tried before the LM.
+    A rule only answers when the whole message matches, the action is in the request catalog (under one of its
+    ACTION_NAMES), the catalog schema knows every parameter and the parameters validate against both the action
+    model and the catalog schema.
+    Modes: "off", "on" (answer without the LM), "shadow" (only compare the rule with the LM decision).
+    """
+
+    def __init__(self, mode: str = "off", kinds=(), rules=RULES):
+        self.mode = mode
+        self.kinds = frozenset(kinds)
+        self.rules = rules
+        self.hits = Counter()
+        self.fallthrough = 0
+        self.shadow_agree = Counter()
+        self.shadow_disagree = Counter()
+
+    @property
+    def enabled(self):
+        return self.mode in ("on", "shadow")
+
+    def route(self, chain, planner_kind, new_message, task_definition, catalog):
+        """(rule, action, parameters, explanation) when a rule is confident, None to fall through to the LM"""
+        if not self.enabled or planner_kind not in self.kinds or not new_message:
+            return None
+        message = " ".join(new_message.split())
+        for name, rule in self.rules.items():
+            matched = rule(message, task_definition, chain)
+            if matched is None:
+                continue
+            model, parameters, explanation = matched
+            fitted = self._fits_catalog(model, parameters, catalog)
+            if fitted is not None:
+                self.hits[name] += 1
+                return name, *fitted, explanation
+        self.fallthrough += 1
+        return None
+
+    def _fits_catalog(self, model, parameters, catalog):
+        """(catalog action name, parameters checked against its schema), None when the rule's decision does not fit"""
+        names = ACTION_NAMES.get(model.__name__, (model.__name__,))
+        by_name = {action["name"]: action for action in catalog.actions}
+        action = next((by_name[name] for name in names if name in by_name), None)
+        if action is None:
+            return None
+        try:
+            model.model_validate(parameters)
+        except ValidationError:
+            return None
+        properties = (action.get("parameters") or {}).get("properties")
+        if properties is None:
+            return action["name"], parameters
+        if not set(parameters) <= set(properties):
+            return None
+        validator = catalog.validators.get(action["name"])
+        if validator is None:
+            validator = catalog.validators[action["name"]] = ParameterValidator(action)
+        parameters, errors = validator.validate(parameters)
+        if errors:
+            return None
+        return action["name"], parameters
+
+    def compare(self, rule, action, parameters, response):
+        """Shadow mode: record whether the LM response agrees with the rule decision"""
+        agree = response.action == action and all(
+            str(response.parameters.get(name)).lower() == str(value).lower()
+            for name, value in parameters.items()
+        )
+        if agree:
+            self.shadow_agree[rule] += 1
+        else:
+            self.shadow_disagree[rule] += 1
+            logger.info(f"fast path shadow disagreement ({rule}): rule {action} {parameters}, LM {response.action} {response.parameters}")
+        return agree
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "hits": dict(self.hits),
+            "fallthrough": self.fallthrough,
+            "shadow_agree": dict(self.shadow_agree),
+            "shadow_disagree": dict(self.shadow_disagree),
+        }
@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from agents.compaction import render_message
+
+
+class SessionConflict(Exception):
+    """Raised when a delta does not line up with the stored session, the client should resend its full history"""
+
+
+def step_size(step) -> int:
+    return len(step.action) + len(step.detail) + len(step.result)
+
+
+class Session:
+    """Chat history and past steps of one conversation, each message is rendered for the prompt once"""
+
+    def __init__(self):
+        self.messages = []
+        self.lines = []  # render_message of each message
+        self.text = ""  # all lines joined
+        self.steps = []
+        self.steps_size = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.text) + self.steps_size
+
+    @property
+    def history_text(self) -> str:
+        """Rendered chat history without the last message, the chat_history prompt input"""
+        return self.text[: len(self.text) - len(self.lines[-1])] if self.lines else ""
+
+    def extend(self, history_start: int, messages, steps_start: int, steps):
+        """Replace everything from history_start and steps_start with the given messages and steps"""
+        if history_start < len(self.messages):
+            del self.messages[history_start:]
+            del self.lines[history_start:]
+            self.text = "".join(self.lines)
+        for message in messages:
+            line = render_message(message)
+            self.messages.append(message)
+            self.lines.append(line)
+            self.text += line
+        if steps_start < len(self.steps):
+            del self.steps[steps_start:]
+            self.steps_size = sum(step_size(step) for step in self.steps)
+        self.steps += steps
+        self.steps_size += sum(step_size(step) for step in steps)
+
+
+class SessionDisk:
+    """
+    sqlite backing store of sessions with one row per message and per step, keyed by their index,
+    so an update writes only the rows of its delta instead of the whole session
+    """
+
+    def __init__(self, path: str, cleanup_interval: float = 60):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._connect()
+        # a sqlite connection must not be shared across fork, worker processes forked by serve.py reconnect
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._cleaned_at = 0.0
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, messages INTEGER, steps INTEGER, expires_at REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        for table in ("session_messages", "session_steps"):
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (session_id TEXT, idx INTEGER, value TEXT, PRIMARY KEY (session_id, idx))"
+            )
+
+    def load(self, session_id):
+        """(messages, steps) as dicts, None when the session is unknown or expired"""
+        with self._lock:
+            row = self._db.execute("SELECT messages, steps, expires_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row[2] < time.time():
+                return None
+            rows = [
+                self._db.execute(
+                    f"SELECT value FROM {table} WHERE session_id = ? AND idx < ? ORDER BY idx", (session_id, count)
+                ).fetchall()
+                for table, count in (("session_messages", row[0]), ("session_steps", row[1]))
+            ]
+        messages, steps = ([json.loads(value) for value, in table_rows] for table_rows in rows)
+        return messages, steps
+
+    def save(self, session_id, session: "Session", history_start: int, steps_start: int, expires_at: float):
+        """Write the messages from history_start and the steps from steps_start, or all of them when the stored rows do not reach there"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT messages, steps, expires_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                if row is None or row[2] < time.time() or row[0] < history_start or row[1] < steps_start:
+                    history_start = steps_start = 0
+                for table, start, items in (
+                    ("session_messages", history_start, session.messages),
+                    ("session_steps", steps_start, session.steps),
+                ):
+                    self._db.execute(f"DELETE FROM {table} WHERE session_id = ? AND idx >= ?", (session_id, start))
+                    self._db.executemany(
+                        f"INSERT INTO {table} (session_id, idx, value) VALUES (?, ?, ?)",
+                        [(session_id, idx, json.dumps(items[idx].model_dump())) for idx in range(start, len(items))],
+                    )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (id, messages, steps, expires_at) VALUES (?, ?, ?, ?)",
+                    (session_id, len(session.messages), len(session.steps), expires_at),
+                )
+                now = time.time()
+                if now - self._cleaned_at > self.cleanup_interval:
+                    self._cleaned_at = now
+                    expired = "SELECT id FROM sessions WHERE expires_at < ?"
+                    for table in ("session_messages", "session_steps"):
+                        self._db.execute(f"DELETE FROM {table} WHERE session_id IN ({expired})", (now,))
+                    self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id) -> bool:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            for table in ("session_messages", "session_steps"):
+                self._db.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+            found = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+            self._db.execute("COMMIT")
+            return found
+
+
+class SessionStore:
+    """
+    Server-side chat history and past steps by session id, so clients only send what is new.
+    Sessions are kept in an LRU bounded by their approximate rendered size and expire after `ttl` seconds idle.
+    With `path` they are also written to sqlite, so they survive restarts and are shared by the workers of serve.py;
+    each update writes only its delta.
+    """
+
+    def __init__(self, message_model, step_model, max_bytes: int = 256 * 1024 * 1024, ttl: float = 3600, path: str | None = None):
+        self.message_model = message_model
+        self.step_model = step_model
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = SessionDisk(path) if path else None
+        self._sessions = OrderedDict()  # session id -> (expires_at, session)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def get(self, session_id) -> Session | None:
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry[0] < time.time():
+            self._drop(session_id)
+            entry = None
+        if entry is not None:
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+        return self._load(session_id)
+
+    def _load(self, session_id) -> Session | None:
+        if self.disk is None:
+            return None
+        stored = self.disk.load(session_id)
+        if stored is None:
+            return None
+        messages, steps = stored
+        session = Session()
+        session.extend(
+            0,
+            [self.message_model.model_validate(message) for message in messages],
+            0,
+            [self.step_model.model_validate(step) for step in steps],
+        )
+        return session
+
+    def update(self, session_id, history_start: int, messages, steps_start: int, steps) -> Session:
+        """
+        Apply a delta: the session's history is cut at history_start and its steps at steps_start, then the
+        messages and steps are appended. Starting at 0 replaces the session, so a full payload always works.
+        """
+        session = self.get(session_id)
+        if session is not None and (history_start > len(session.messages) or steps_start > len(session.steps)):
+            # another worker may have moved the session further
+            session = self._load(session_id) or session
+        if session is None:
+            if history_start or steps_start:
+                self.misses += 1
+                self.conflicts += 1
+                raise SessionConflict(f"Unknown session_id: {session_id}, resend the full chat history and past steps")
+            session = Session()
+            self.created += 1
+        elif history_start > len(session.messages) or steps_start > len(session.steps):
+            self.conflicts += 1
+            raise SessionConflict(
+                f"Session {session_id} has {len(session.messages)} messages and {len(session.steps)} steps, "
+                f"got a delta from message {history_start} and step {steps_start}"
+            )
+        else:
+            self.hits += 1
+
+        if session_id in self._sessions:
+            self._drop(session_id)
+        session.extend(history_start, messages, steps_start, steps)
+        expires_at = time.time() + self.ttl
+        if session.size <= self.max_bytes:
+            self._sessions[session_id] = (expires_at, session)
+            self._bytes += session.size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._sessions)))
+                self.evictions += 1
+        if self.disk is not None:
+            self.disk.save(session_id, session, history_start, steps_start, expires_at)
+        return session
+
+    def delete(self, session_id) -> bool:
+        found = session_id in self._sessions
+        if found:
+            self._drop(session_id)
+        if self.disk is not None:
+            found = self.disk.delete(session_id) or found
+        return found
+
+    def _drop(self, session_id):
+        _, session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,54 @@
+import time
+from collections import OrderedDict
+
+
+class SwitchTracker:
+    """
+    Bookkeeping of task switches resolved in the same /plan call.
+    The time clients that do not opt in take between a SWITCH_TASK answer and their switched_task follow-up request
+    is measured, and its moving average is counted as saved for every switch resolved server side.
+    """
+
+    def __init__(self, max_pending: int = 10000, max_gap: float = 60):
+        self.max_pending = max_pending
+        self.max_gap = max_gap  # longer gaps are a user typing, not a client round trip
+        self._pending = OrderedDict()  # follow-up key -> when the SWITCH_TASK answer was sent
+        self.round_trip = None  # moving average seconds
+        self.follow_ups = 0
+        self.resolved = 0
+        self.failed = 0
+        self.saved_seconds = 0.0
+
+    def expect_follow_up(self, key):
+        self._pending.pop(key, None)
+        self._pending[key] = time.perf_counter()
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def observe_follow_up(self, key, arrived_at: float):
+        sent_at = self._pending.pop(key, None)
+        if sent_at is None or not 0 <= arrived_at - sent_at <= self.max_gap:
+            return
+        gap = arrived_at - sent_at
+        self.follow_ups += 1
+        self.round_trip = gap if self.round_trip is None else 0.9 * self.round_trip + 0.1 * gap
+
+    def record_resolved(self) -> float | None:
+        """Estimated seconds saved by one resolved switch, None until a client round trip has been measured"""
+        self.resolved += 1
+        if self.round_trip is None:
+            return None
+        self.saved_seconds += self.round_trip
+        return self.round_trip
+
+    def record_failed(self):
+        self.failed += 1
+
+    def stats(self):
+        return {
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "follow_ups": self.follow_ups,
+            "round_trip_ms": round(self.round_trip * 1000, 1) if self.round_trip is not None else None,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,301 @@
+import json
+import threading
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+import dspy
+from loguru import logger
+
+from agents import action as action_models
+from agents.catalog import GENERAL_CHAT_ACTION, RESPONSE_ALIASES, SWITCH_TASK_ACTION, WRAP_UP_ACTION
+from agents.planner import RepairParameters
+
+# Actions the planner may pick on top of the catalog, see ActionCatalog.prompt
+EXTRA_ACTIONS = {action["name"]: action for action in (WRAP_UP_ACTION, GENERAL_CHAT_ACTION)}
+
+NULL_STRINGS = {"", "null", "none"}
+
+
+def numeric(value):
+    """Decimal for a finite numeric string, None otherwise"""
+    try:
+        number = Decimal(value.strip().replace(",", ""))
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+def decimal_text(value) -> str:
+    """Plain decimal notation of a float or Decimal, repr keeps every significant digit of a float"""
+    text = format(Decimal(repr(value)) if isinstance(value, float) else value, 'f')
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+
+def compile_type(name: str, schema: dict):
+    """Check for one JSON schema type, returns (value, error) with cheap coercions applied"""
+    if name == "string":
+        def check(value):
+            if isinstance(value, str):
+                return value, None
+            if isinstance(value, (float, Decimal)):
+                return decimal_text(value), None  # not str(), 0.00001 would become '1e-05'
+            if isinstance(value, int) and not isinstance(value, bool):
+                return str(value), None
+            return value, "expected a string"
+    elif name in ("number", "integer"):
+        def check(value):
+            if isinstance(value, bool):
+                return value, f"expected {name}"
+            if isinstance(value, str):
+                number = numeric(value)
+                if number is None:
+                    return value, f"expected {name}"
+                value = number
+            if name == "integer":
+                if isinstance(value, int):
+                    return value, None
+                if isinstance(value, (float, Decimal)) and value == int(value):
+                    return int(value), None
+                return value, "expected integer"
+            if isinstance(value, (int, float, Decimal)):
+                return value, None
+            return value, "expected number"
+    elif name == "boolean":
+        def check(value):
+            if isinstance(value, bool):
+                return value, None
+            if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+                return value.strip().lower() == "true", None
+            return value, "expected boolean"
+    elif name == "array":
+        items = compile_property(schema["items"]) if isinstance(schema.get("items"), dict) else None
+
+        def check(value):
+            if not isinstance(value, list):
+                value = [value]  # a single item where a list is expected
+            if items is None:
+                return value, None
+            checked = []
+            for item in value:
+                item, error = items(item)
+                if error is not None:
+                    return value, f"item {error}"
+                checked.append(item)
+            return checked, None
+    elif name == "object":
+        def check(value):
+            return value, None if isinstance(value, dict) else "expected object"
+    elif name == "null":
+        def check(value):
+            if value is None or (isinstance(value, str) and value.strip().lower() in NULL_STRINGS):
+                return None, None
+            return value, "expected null"
+    else:
+        def check(value):
+            return value, None
+    return check
+
+
+def compile_property(schema: dict):
+    """Precompiled check of one property schema: anyOf, enum and type, returns (value, error)"""
+    if "anyOf" in schema:
+        options = [compile_property(option) for option in schema["anyOf"]]
+
+        def check_any(value):
+            first_error = None
+            for option in options:
+                checked, error = option(value)
+                if error is None:
+                    return checked, None
+                first_error = first_error or error
+            return value, first_error
+
+        return check_any
+
+    types = schema.get("type")
+    checks = [compile_type(name, schema) for name in (types if isinstance(types, list) else [types] if types else [])]
+    enum = schema.get("enum")
+    by_case = {}
+    if enum:
+        for option in enum:
+            if isinstance(option, str):
+                by_case.setdefault(option.casefold(), []).append(option)
+
+    def check(value):
+        error = None
+        for type_check in checks:
+            checked, error = type_check(value)
+            if error is None:
+                value = checked
+                break
+        if error is not None:
+            return value, error
+        if enum is not None and value not in enum:
+            matches = by_case.get(value.casefold(), []) if isinstance(value, str) else []
+            if len(matches) != 1:
+                return value, f"expected one of {enum}"
+            value = matches[0]
+        return value, None
+
+    return check
+
+
+class ParameterValidator:
+    """Validator compiled once from the parameter schema of an action, coerces cheap mistakes and lists what is left"""
+
+    def __init__(self, action: dict):
+        schema = action.get("parameters") or {}
+        self.properties = {name: compile_property(prop) for name, prop in (schema.get("properties") or {}).items()}
+        self.required = list(schema.get("required") or [])
+        # strict schemas list every field as required and mark the optional ones nullable, a missing one is filled with null
+        self.nullable = {name for name, check in self.properties.items() if check(None)[1] is None}
+        self.strict = bool(self.properties) and (
+            action.get("additionalProperties") is False or schema.get("additionalProperties") is False
+        )
+
+    def validate(self, parameters: dict):
+        """(coerced parameters, errors)"""
+        coerced = {}
+        errors = []
+        for name, value in parameters.items():
+            check = self.properties.get(name)
+            if check is None:
+                if self.strict:
+                    errors.append(f"{name}: unknown parameter")
+                coerced[name] = value
+                continue
+            if value is None and name not in self.required:
+                coerced[name] = None
+                continue
+            value, error = check(value)
+            if error is not None:
+                errors.append(f"{name}: {error}, got {value!r}")
+            coerced[name] = value
+        for name in self.required:
+            if name in coerced:
+                continue
+            if name in self.nullable:
+                coerced[name] = None
+            else:
+                errors.append(f"{name}: required")
+        return coerced, errors
+
+
+def model_action(name: str) -> dict | None:
+    """Action schema from the pydantic models in agents/action.py, for actions the request catalog does not describe"""
+    model = getattr(action_models, name, None)
+    if not (isinstance(model, type) and issubclass(model, action_models.ToolBase)) or model is action_models.ToolBase:
+        return None
+    return {"name": name, "parameters": model.model_json_schema()}
+
+
+def find_action(catalog, name: str, allow_switch_task: bool = False) -> dict | None:
+    for action in catalog.actions:
+        if action.get("name") == name:
+            # clients may send an action without its schema, the pydantic model then describes it
+            return action if action.get("parameters") is not None else model_action(name) or action
+    if name in EXTRA_ACTIONS:
+        return EXTRA_ACTIONS[name]
+    if allow_switch_task and name == SWITCH_TASK_ACTION["name"]:
+        return SWITCH_TASK_ACTION
+    return None
+
+
+def action_name(action) -> str:
+    name = action.strip().strip('"')
+    return RESPONSE_ALIASES.get(name, name)
+
+
+class InvalidPlan(Exception):
+    """Raised when the planned parameters do not validate and could not be repaired"""
+
+
+class PlanValidator:
+    """
+    Validate planned parameters against the chosen action's schema with validators compiled once per catalog action.
+    Cheap mistakes (numeric strings, enum casing, a single item for a list) are coerced; what still fails gets
+    one repair call that only sees the request, the action schema, the invalid parameters and the errors.
+    Counts how often each path is taken: valid, coerced, repaired, repair_failed, invalid, unknown_action.
+    """
+
+    def __init__(self, repair: bool = True):
+        self.repair_enabled = repair
+        self.repair_program = dspy.Predict(RepairParameters)
+        self.paths = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, path):
+        with self._lock:
+            self.paths[path] += 1
+
+    def validator(self, catalog, name, allow_switch_task=False) -> ParameterValidator | None:
+        if name == SWITCH_TASK_ACTION["name"] and not allow_switch_task:
+            return None
+        validators = catalog.validators
+        if name not in validators:
+            action = find_action(catalog, name, allow_switch_task=True)
+            validators[name] = ParameterValidator(action) if action is not None else None
+        return validators[name]
+
+    def check(self, catalog, action, parameters, allow_switch_task=False):
+        """(coerced parameters, problem) for a planned action, problem is None when it can be executed"""
+        if not isinstance(action, str):
+            return parameters, f"action is not a string: {action!r}"
+        name = action_name(action)
+        validator = self.validator(catalog, name, allow_switch_task)
+        if validator is None:
+            return parameters, f"action {name} is not in the catalog"
+        if not isinstance(parameters, dict):
+            return parameters, f"parameters of {name} is not an object: {parameters!r}"
+        coerced, errors = validator.validate(parameters)
+        if errors:
+            return coerced, f"invalid parameters for {name}: {'; '.join(errors)}"
+        return coerced, None
+
+    def validate(self, catalog, action, parameters, request_text, allow_switch_task=False):
+        """
+        Parameters ready to return for a planned action, coerced or repaired when needed.
+        Actions outside the catalog are passed through unchanged. Runs on a planner thread, it may call the LM.
+        """
+        if not isinstance(action, str) or self.validator(catalog, action_name(action), allow_switch_task) is None:
+            self.count("unknown_action")
+            return parameters
+        coerced, problem = self.check(catalog, action, parameters, allow_switch_task)
+        if problem is None:
+            self.count("coerced" if coerced != parameters else "valid")
+            return coerced
+        if not self.repair_enabled:
+            self.count("invalid")
+            raise InvalidPlan(problem)
+
+        repaired = self.repair(catalog, action, parameters, problem, request_text, allow_switch_task)
+        if repaired is None:
+            self.count("repair_failed")
+            raise InvalidPlan(problem)
+        self.count("repaired")
+        logger.info(f"repaired parameters for {action}: {parameters} -> {repaired}")
+        return repaired
+
+    def repair(self, catalog, action, parameters, problem, request_text, allow_switch_task=False):
+        """Parameters fixed by one minimal-context LM call, None when the repair does not validate either"""
+        name = action_name(action)
+        schema = find_action(catalog, name, allow_switch_task)
+        prompt_schema = {key: schema[key] for key in ("name", "description", "parameters") if key in schema}
+        try:
+            repaired = self.repair_program(
+                request=request_text,
+                action_schema=json.dumps(prompt_schema, ensure_ascii=False, default=str),
+                parameters=json.dumps(parameters, ensure_ascii=False, default=str),
+                errors=problem,
+            ).fixed_parameters
+        except Exception as e:
+            logger.warning(f"parameter repair for {name} failed: {e}")
+            return None
+        repaired, problem = self.check(catalog, action, repaired, allow_switch_task)
+        if problem is not None:
+            logger.warning(f"repaired parameters still invalid: {problem}")
+            return None
+        return repaired
+
+    def stats(self):
+        return {"repair": self.repair_enabled, "paths": dict(self.paths)}
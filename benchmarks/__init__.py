@@ -0,0 +1 @@
+# Offline benchmarks for the planner service, run with `python -m benchmarks.<name>`
@@ -0,0 +1,75 @@
+"""
+N single /plan calls against one /plan/batch call of N, with a stub LM.
+
+    python -m benchmarks.batch --latency 0.5 --sizes 8 32 128
+"""
+import argparse
+import asyncio
+import time
+
+import dspy
+import httpx
+
+import main
+from benchmarks.load_test import SAMPLE_REQUEST
+from benchmarks.stub_lm import StubLM
+
+
+def batch_requests(size: int) -> list[dict]:
+    # mix chains and planner kinds so the batch has several groups
+    requests = []
+    for i in range(size):
+        request = dict(SAMPLE_REQUEST, chain="bsc" if i % 2 else "solana", switched_task=bool(i % 3))
+        request["chat_history"] = SAMPLE_REQUEST["chat_history"] + [{"role": "user", "content": f"request {i}"}]
+        requests.append(request)
+    return requests
+
+
+def rejected(status_codes) -> int:
+    """Requests shed by the saturated planner executor, any other error stops the benchmark"""
+    failed = [status_code for status_code in status_codes if status_code not in (200, 503)]
+    assert not failed, failed
+    return status_codes.count(503)
+
+
+async def sequential(client, requests):
+    return rejected([(await client.post("/plan", json=request)).status_code for request in requests])
+
+
+async def concurrent(client, requests):
+    # more requests than PLANNER_MAX_CONCURRENCY + PLANNER_MAX_QUEUE get 503, that is part of the comparison
+    responses = await asyncio.gather(*(client.post("/plan", json=request) for request in requests))
+    return rejected([response.status_code for response in responses])
+
+
+async def batch(client, requests):
+    response = await client.post("/plan/batch", json={"requests": requests})
+    response.raise_for_status()
+    return rejected([item["status_code"] for item in response.json()["results"]])
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"stub latency {args.latency}s")
+        print(f"{'size':>6} {'sequential s':>13} {'concurrent s':>13} {'503':>5} {'batch s':>8} {'503':>5}")
+        for size in args.sizes:
+            requests = batch_requests(size)
+            timings = []
+            shed = []
+            for mode in (sequential, concurrent, batch):
+                start = time.perf_counter()
+                shed.append(await mode(client, requests))
+                timings.append(time.perf_counter() - start)
+            print(f"{size:>6} {timings[0]:>13.2f} {timings[1]:>13.2f} {shed[1]:>5} {timings[2]:>8.2f} {shed[2]:>5}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LM latency in seconds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32, 128])
+    args = parser.parse_args()
+
+    dspy.configure(lm=StubLM(latency=args.latency))
+    main.coalescer = None  # every mode sends the same requests, they must each reach the planner
+    asyncio.run(run(args))
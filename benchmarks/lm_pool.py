@@ -0,0 +1,84 @@
+"""
+LM pool against local stub OpenAI servers: tail latency with and without hedging, and failover
+when one endpoint fails every request.
+
+    python -m benchmarks.lm_pool --requests 200 --concurrency 16
+
+Starts two stub servers with the same heavy-tailed latency, then runs the same calls through
+a single endpoint, the pool without hedging, the pool with hedging, and the pool with one endpoint down.
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+
+from agents.lm_pool import LMEndpointConfig, LMPool
+from benchmarks.replay import percentile
+from benchmarks.stub_openai import create_app
+
+MESSAGES = [{"role": "user", "content": "check my wallet balance"}]
+
+
+def start_stub(port, **kwargs) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(create_app(**kwargs), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def pool(ports, **kwargs) -> LMPool:
+    configs = [LMEndpointConfig(model="openai/stub", api_base=f"http://127.0.0.1:{port}/v1", api_key="stub", cache=False) for port in ports]
+    return LMPool.from_config(configs, **kwargs)
+
+
+def run(name, lm, requests, concurrency):
+    latencies = []
+    errors = 0
+
+    def one(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            lm.forward(messages=MESSAGES)
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        list(threads.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    stats = lm.stats()
+    print(
+        f"{name:<24} {requests / elapsed:>7.1f} {percentile(latencies, 50) * 1000:>8.1f} "
+        f"{percentile(latencies, 95) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} {errors:>6} "
+        f"{stats['hedges']:>6} {stats['failovers']:>9}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="Median stub latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.8, help="Log-normal spread of the stub latency")
+    args = parser.parse_args()
+
+    start_stub(9101, latency=args.latency, latency_sigma=args.latency_sigma, seed=1)
+    start_stub(9102, latency=args.latency, latency_sigma=args.latency_sigma, seed=2)
+    start_stub(9103, error_rate=1.0)
+
+    print(f"{'':<24} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'hedges':>6} {'failovers':>9}")
+    run("single endpoint", pool([9101]), args.requests, args.concurrency)
+    run("pool", pool([9101, 9102]), args.requests, args.concurrency)
+    hedged = pool([9101, 9102], hedge=True)
+    run("pool, hedged (warm-up)", hedged, args.requests, args.concurrency)
+    run("pool, hedged", hedged, args.requests, args.concurrency)
+    down = pool([9103, 9101], failure_threshold=3, cooldown=60)
+    run("pool, one endpoint down", down, args.requests, args.concurrency)
+    print({name: endpoint["state"] for name, endpoint in down.stats()["endpoints"].items()})
@@ -0,0 +1,76 @@
+"""
+Load test for /plan against a stub LM, shows that throughput scales with the number of in-flight requests.
+
+    python -m benchmarks.load_test --latency 0.5 --requests 64 --concurrency 1 4 16 32
+"""
+import argparse
+import asyncio
+import time
+
+import dspy
+import httpx
+
+import main
+from benchmarks.stub_lm import StubLM
+
+SAMPLE_REQUEST = {
+    "chat_history": [
+        {"role": "assistant", "content": "How can I help you?", "attachments": None},
+        {"role": "user", "content": "check my wallet balance", "attachments": []},
+    ],
+    "task_definition": "Check the wallet balance",
+    "actions": [
+        {
+            "name": "WALLET_PORTFOLIO",
+            "strict": True,
+            "additionalProperties": False,
+            "description": "Get the wallet total balance or specific token balance in agent wallet",
+            "parameters": {
+                "type": "object",
+                "properties": {"queryType": {"type": "string", "enum": ["walletBalance", "tokenBalance"]}},
+            },
+        }
+    ],
+    "past_steps": [],
+    "switched_task": True,
+}
+
+
+async def run_level(client, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+
+    async def one():
+        async with semaphore:
+            response = await client.post("/plan", json=SAMPLE_REQUEST)
+            statuses.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    return elapsed, statuses
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"stub latency {args.latency}s, {args.requests} requests per level, executor {main.executor.stats()}")
+        print(f"{'concurrency':>12} {'seconds':>9} {'req/s':>8} {'ok':>5} {'503':>5}")
+        for concurrency in args.concurrency:
+            elapsed, statuses = await run_level(client, args.requests, concurrency)
+            print(
+                f"{concurrency:>12} {elapsed:>9.2f} {args.requests / elapsed:>8.1f} "
+                f"{statuses.count(200):>5} {statuses.count(503):>5}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LM latency in seconds")
+    parser.add_argument("--requests", type=int, default=64, help="Requests sent per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    dspy.configure(lm=StubLM(latency=args.latency))
+    main.coalescer = None  # the requests are identical, they must each reach the planner
+    asyncio.run(run(args))
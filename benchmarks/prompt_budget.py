@@ -0,0 +1,83 @@
+"""
+Prompt tokens and latency against session length, with and without the prompt token budget.
+
+    python -m benchmarks.prompt_budget --budget 3000 --turns 4 16 64 --latency-per-1k 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import dspy
+import httpx
+
+import main
+from agents.compaction import PromptBudget, PromptCompactor
+from agents.planner import FIRST_STEP, SWITCH_TASK, LOOP
+from benchmarks.stub_lm import StubLM
+
+STEP_RESULT = "Token info: price 0.00169 SOL, market cap 1.2M, holders 4312, top10 31%, liquidity 210k. " * 20
+
+
+def session(turns: int) -> dict:
+    chat_history = []
+    past_steps = []
+    for i in range(turns):
+        chat_history.append({"role": "user", "content": f"analyze token number {i} and tell me if it is worth buying"})
+        chat_history.append({"role": "assistant", "content": f"Token {i} looks healthy, liquidity is fine and the holders are spread out."})
+        past_steps.append({"action": "ANALYZE_TOKEN", "detail": f"analyze token {i}", "result": STEP_RESULT})
+    chat_history.append({"role": "user", "content": "now buy 0.1 SOL of the last one"})
+    return {
+        "chat_history": chat_history,
+        "task_definition": "Buy 0.1 SOL of the last analyzed token",
+        "catalog_id": "default",
+        "past_steps": past_steps,
+        "switched_task": False,
+    }
+
+
+async def measure(client, lm, body, repeat):
+    latencies = []
+    tokens = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.post("/plan", json=body)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        tokens.append(lm.history[-1]["usage"]["prompt_tokens"])
+    return sum(tokens) / len(tokens), sum(latencies) / len(latencies)
+
+
+async def run(args, lm):
+    transport = httpx.ASGITransport(app=main.app)
+    budgets = {
+        kind: PromptBudget(max_tokens=args.budget)
+        for kind in (FIRST_STEP, SWITCH_TASK, LOOP)
+    }
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"budget {args.budget} tokens, stub latency {args.latency}s + {args.latency_per_1k}s per 1k prompt tokens")
+        print(f"{'turns':>6} {'tokens before':>14} {'tokens after':>13} {'ms before':>10} {'ms after':>9}")
+        for turns in args.turns:
+            body = session(turns)
+            main.compactor = PromptCompactor({})
+            tokens_before, latency_before = await measure(client, lm, body, args.repeat)
+            main.compactor = PromptCompactor(budgets)
+            tokens_after, latency_after = await measure(client, lm, body, args.repeat)
+            print(
+                f"{turns:>6} {tokens_before:>14.0f} {tokens_after:>13.0f} "
+                f"{latency_before * 1000:>10.1f} {latency_after * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=3000, help="Token budget for chat history and past steps")
+    parser.add_argument("--turns", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub LM base latency in seconds")
+    parser.add_argument("--latency-per-1k", type=float, default=0.05, help="Stub LM latency per 1k prompt tokens")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lm = StubLM(latency=args.latency, latency_per_1k_prompt_tokens=args.latency_per_1k)
+    dspy.configure(lm=lm)
+    main.coalescer = None  # the requests are identical, they must each reach the planner
+    asyncio.run(run(args, lm))
@@ -0,0 +1,178 @@
+"""
+Replay a JSONL corpus of /plan request bodies at several concurrency levels and report latency percentiles,
+throughput, CPU time per request and memory. Runs the app in-process with the stub LM by default,
+or against a running server with --url (for example one started with `python -m benchmarks.serve_stub`).
+
+    python -m benchmarks.replay --corpus corpus.jsonl --latency 0.5 --latency-sigma 0.4 --concurrency 1 8 32
+    python -m benchmarks.replay --corpus corpus.jsonl --url http://127.0.0.1:8000 --server-pid 12345
+
+Without --corpus a synthetic corpus built around benchmarks.load_test.SAMPLE_REQUEST is replayed.
+In-process, CPU and memory are those of the benchmark process, so they include the client;
+over HTTP they are read from /proc for --server-pid (Linux only).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import dspy
+import httpx
+from loguru import logger
+
+import main
+from benchmarks.load_test import SAMPLE_REQUEST
+from benchmarks.serve_stub import add_stub_arguments, stub_from_arguments
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def load_corpus(path: str) -> list[dict]:
+    corpus = []
+    skipped = 0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                body = json.loads(line)
+                main.PlanRequest.model_validate(body)
+            except Exception:
+                skipped += 1
+                continue
+            corpus.append(body)
+    if skipped:
+        logger.warning(f"skipped {skipped} lines of {path} that are not PlanRequest bodies")
+    if not corpus:
+        raise SystemExit(f"no PlanRequest bodies in {path}")
+    return corpus
+
+
+def synthetic_corpus(size: int = 64) -> list[dict]:
+    # vary history length, chain and planner kind so prompts are not all the same size
+    corpus = []
+    for i in range(size):
+        history = list(SAMPLE_REQUEST["chat_history"])
+        for turn in range(i % 12):
+            history.append({"role": "user" if turn % 2 else "assistant", "content": f"message {turn} of request {i} " * 8})
+        corpus.append(dict(SAMPLE_REQUEST, chat_history=history, chain="bsc" if i % 4 == 0 else "solana", switched_task=bool(i % 3)))
+    return corpus
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def process_usage(pid=None):
+    """(cpu seconds, rss bytes) of this process or of `pid`, None when it cannot be read"""
+    if pid is None:
+        times = os.times()
+        cpu = times.user + times.system
+        path = "/proc/self/statm"
+    else:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime, stime
+        except OSError:
+            return None, None
+        path = f"/proc/{pid}/statm"
+    try:
+        with open(path) as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        rss = None
+    return cpu, rss
+
+
+async def run_level(client, corpus, total, concurrency, endpoint):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status = (await client.post(endpoint, json=corpus[i % len(corpus)])).status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, sorted(latencies), statuses
+
+
+async def run(args, corpus):
+    if args.url:
+        transport = None
+        base_url = args.url
+        pid = args.server_pid
+    else:
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://bench"
+        pid = None
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=None, limits=limits) as client:
+        if args.warmup:
+            await run_level(client, corpus, args.warmup, min(args.warmup, max(args.concurrency)), args.endpoint)
+
+        print(f"{len(corpus)} corpus requests, {args.requests} per level, target {args.url or 'in-process'}")
+        print(
+            f"{'concurrency':>12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'ok':>5} {'errors':>6} {'cpu ms/req':>10} {'rss MB':>8}"
+        )
+        for concurrency in args.concurrency:
+            cpu_before, _ = process_usage(pid)
+            elapsed, latencies, statuses = await run_level(client, corpus, args.requests, concurrency, args.endpoint)
+            cpu_after, rss = process_usage(pid)
+            result = {
+                "concurrency": concurrency,
+                "requests": args.requests,
+                "rps": args.requests / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "ok": statuses.count(200),
+                "errors": len(statuses) - statuses.count(200),
+                "cpu_ms_per_request": (cpu_after - cpu_before) / args.requests * 1000 if cpu_after is not None else None,
+                "rss_mb": rss / 2**20 if rss is not None else None,
+            }
+            results.append(result)
+            cpu = f"{result['cpu_ms_per_request']:.2f}" if result["cpu_ms_per_request"] is not None else "n/a"
+            rss_mb = f"{result['rss_mb']:.1f}" if result["rss_mb"] is not None else "n/a"
+            print(
+                f"{concurrency:>12} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['ok']:>5} {result['errors']:>6} {cpu:>10} {rss_mb:>8}"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSONL file with one PlanRequest body per line")
+    parser.add_argument("--url", help="Replay against a running server instead of in-process")
+    parser.add_argument("--server-pid", type=int, help="Server process to read CPU and memory from when using --url")
+    parser.add_argument("--endpoint", default="/plan")
+    parser.add_argument("--requests", type=int, default=256, help="Requests sent per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--warmup", type=int, default=8, help="Requests sent before measuring")
+    parser.add_argument("--output", help="Write the results as JSON, for comparing runs")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not args.url:
+        dspy.configure(lm=stub_from_arguments(args))
+    results = asyncio.run(run(args, corpus))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
@@ -0,0 +1,41 @@
+"""
+Serve the app with the OpenAI LM swapped for the stub LM, for replaying over HTTP without network access.
+
+    python -m benchmarks.serve_stub --latency 0.5 --latency-sigma 0.4 --completion-tokens 120 --port 8000
+"""
+import argparse
+
+import dspy
+import uvicorn
+
+import main
+from benchmarks.stub_lm import StubLM
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="Median stub LM latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of the stub LM latency")
+    parser.add_argument("--latency-per-1k", type=float, default=0.0, help="Extra stub LM latency per 1k prompt tokens")
+    parser.add_argument("--completion-tokens", type=int, default=0, help="Median completion tokens, 0 for the bare plan")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def stub_from_arguments(args) -> StubLM:
+    return StubLM(
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        latency_per_1k_prompt_tokens=args.latency_per_1k,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_stub_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    dspy.configure(lm=stub_from_arguments(args))
+    uvicorn.run(main.app, host=args.host, port=args.port)
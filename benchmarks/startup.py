@@ -0,0 +1,107 @@
+"""
+Startup time and per-worker memory of the production serve mode.
+
+    python -m benchmarks.startup --workers 4 --port 8099
+
+Reports the time to import main in a fresh interpreter, the time until the first worker answers /readyz
+and until every worker has logged that it is ready, RSS and PSS per worker (PSS splits the pages shared
+by the pre-forked workers between them), and how long the server takes to drain on SIGTERM.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+
+def import_seconds() -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def children(pid: int) -> list[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def memory_mb(pid: int) -> dict:
+    """Rss and Pss in MB from /proc/<pid>/smaps_rollup"""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    memory[name.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def main(args):
+    print(f"import main: {import_seconds():.2f}s")
+
+    command = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers)]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    ready_workers = []
+    all_ready = threading.Event()
+
+    def watch_log():
+        for line in server.stderr:
+            if "planner ready" in line:
+                ready_workers.append(time.perf_counter() - start)
+                if len(ready_workers) == args.workers:
+                    all_ready.set()
+
+    threading.Thread(target=watch_log, daemon=True).start()
+
+    first_ready = None
+    deadline = time.perf_counter() + args.timeout
+    while first_ready is None and time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/readyz", timeout=1).status_code == 200:
+                first_ready = time.perf_counter() - start
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    all_ready.wait(max(deadline - time.perf_counter(), 0))
+
+    try:
+        if first_ready is None:
+            raise SystemExit(f"server not ready after {args.timeout}s")
+        print(f"first worker ready: {first_ready:.2f}s")
+        if all_ready.is_set():
+            print(f"all {args.workers} workers ready: {ready_workers[-1]:.2f}s")
+        parent = memory_mb(server.pid)
+        print(f"parent {server.pid}: rss {parent.get('rss', 0):.1f} MB, pss {parent.get('pss', 0):.1f} MB")
+        for pid in children(server.pid):
+            memory = memory_mb(pid)
+            print(f"worker {pid}: rss {memory.get('rss', 0):.1f} MB, pss {memory.get('pss', 0):.1f} MB")
+    finally:
+        stop = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        server.wait(args.timeout)
+        print(f"drained and stopped: {time.perf_counter() - stop:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--timeout", type=float, default=60)
+    main(parser.parse_args())
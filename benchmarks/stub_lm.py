@@ -0,0 +1,113 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import dspy
+
+# every output field any planner signature can ask for, the chat adapter ignores the ones it does not need
+DEFAULT_OUTPUTS = {
+    "is_same_task": "The task definition is the same",
+    "should_repeat_last_step": "Last step is not pending, no need to repeat",
+    "summary_of_past_steps": "You should wrap up the process with \"WRAP_UP\"",
+    "same_task": True,
+    "last_step_status": "not_pending",
+    "task_done": True,
+    "action": "WRAP_UP",
+    "parameters": {"message": "Done"},
+    "action_description": "Wrap up the process",
+}
+
+
+def format_outputs(outputs: dict) -> str:
+    text = ""
+    for name, value in outputs.items():
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        text += f"[[ ## {name} ## ]]\n{value}\n\n"
+    return text + "[[ ## completed ## ]]"
+
+
+def count_prompt_tokens(messages) -> int:
+    return sum(len(str(m.get("content", ""))) for m in messages or []) // 4
+
+
+class StubLM(dspy.BaseLM):
+    """
+    Local stand-in for the OpenAI LM, answers with a fixed plan after `latency` seconds
+    plus `latency_per_1k_prompt_tokens` for every thousand prompt tokens.
+    With `latency_sigma` the latency is drawn from a log-normal distribution around that median,
+    with `completion_tokens` the answer is padded to a log-normal number of tokens around that median.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        outputs: dict | None = None,
+        latency_per_1k_prompt_tokens: float = 0.0,
+        latency_sigma: float = 0.0,
+        completion_tokens: int = 0,
+        completion_tokens_sigma: float = 0.5,
+        seed: int | None = None,
+    ):
+        super().__init__(model="stub/planner", cache=False)
+        self.latency = latency
+        self.latency_per_1k_prompt_tokens = latency_per_1k_prompt_tokens
+        self.latency_sigma = latency_sigma
+        self.completion_tokens = completion_tokens
+        self.completion_tokens_sigma = completion_tokens_sigma
+        self.outputs = {**DEFAULT_OUTPUTS, **(outputs or {})}
+        self._random = random.Random(seed)
+
+    def _delay(self, messages):
+        delay = self.latency + self.latency_per_1k_prompt_tokens * count_prompt_tokens(messages) / 1000
+        if self.latency_sigma:
+            delay *= self._random.lognormvariate(0, self.latency_sigma)
+        return delay
+
+    def _outputs(self):
+        if not self.completion_tokens:
+            return self.outputs
+        tokens = int(self.completion_tokens * self._random.lognormvariate(0, self.completion_tokens_sigma))
+        padding = " ".join(["step"] * max(tokens - len(format_outputs(self.outputs)) // 4, 0))
+        return {**self.outputs, "action_description": f"{self.outputs['action_description']} {padding}".strip()}
+
+    def _response(self, messages):
+        prompt_tokens = count_prompt_tokens(messages)
+        content = format_outputs(self._outputs())
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+            },
+            model=self.model,
+        )
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        time.sleep(self._delay(messages))
+        return self._response(messages)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        stream = dspy.settings.send_stream
+        if stream is None:
+            await asyncio.sleep(self._delay(messages))
+            return self._response(messages)
+
+        # streamed like litellm: the text arrives in small chunks spread over the latency
+        from litellm import ModelResponseStream
+
+        response = self._response(messages)
+        content = response.choices[0].message.content
+        pieces = [content[i : i + 8] for i in range(0, len(content), 8)]
+        caller = dspy.settings.caller_predict
+        delay = self._delay(messages)
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            chunk = ModelResponseStream(model=self.model, choices=[{"index": 0, "delta": {"content": piece}}])
+            if caller is not None:
+                chunk.predict_id = id(caller)
+            await stream.send(chunk)
+        return response
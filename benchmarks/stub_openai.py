@@ -0,0 +1,94 @@
+"""
+Local OpenAI-compatible chat completions server answering with the stub plan, for exercising the LM pool
+(hedging, failover, circuit breaking) without network access.
+
+    python -m benchmarks.stub_openai --port 9001 --latency 0.3 --latency-sigma 0.5 --error-rate 0.05
+    LM_POOL='[{"model": "openai/stub", "api_base": "http://127.0.0.1:9001/v1", "api_key": "stub"}]' python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.stub_lm import DEFAULT_OUTPUTS, count_prompt_tokens, format_outputs
+
+
+def create_app(latency: float = 0.3, latency_sigma: float = 0.0, error_rate: float = 0.0, seed: int | None = None):
+    app = FastAPI(title="Stub OpenAI")
+    rng = random.Random(seed)
+    app.state.latency = latency
+    app.state.error_rate = error_rate
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        delay = app.state.latency * (rng.lognormvariate(0, latency_sigma) if latency_sigma else 1)
+        if rng.random() < app.state.error_rate:
+            await asyncio.sleep(delay / 4)
+            return JSONResponse(status_code=503, content={"error": {"message": "stub overloaded", "type": "server_error"}})
+
+        content = format_outputs(DEFAULT_OUTPUTS)
+        prompt_tokens = count_prompt_tokens(body.get("messages"))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            pieces = [content[i : i + 8] for i in range(0, len(content), 8)]
+            for piece in pieces:
+                await asyncio.sleep(delay / len(pieces))
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            last = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(last)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=0.3, help="Median response latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.latency_sigma, args.error_rate, args.seed), host=args.host, port=args.port, log_level="warning")
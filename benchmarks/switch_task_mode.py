@@ -0,0 +1,120 @@
+"""
+Compare the full and lean output modes of the SWITCH_TASK planner on a corpus of /plan request bodies:
+how often both pick the same action and parameters, completion tokens and LM latency per mode.
+Requests that do not go to the SWITCH_TASK planner are skipped. Uses the configured LM (OPENAI_API_KEY or LM_POOL)
+with its response cache turned off, or the stub LM with --stub to check the harness without network access.
+
+    python -m benchmarks.switch_task_mode --corpus corpus.jsonl --concurrency 8 --output switch_task_mode.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+
+import main
+from agents.planner import SWITCH_TASK, SWITCH_TASK_MODES, PlannerRegistry
+from benchmarks.replay import load_corpus, percentile, synthetic_corpus
+from benchmarks.serve_stub import add_stub_arguments, stub_from_arguments
+
+
+def switch_task_inputs(corpus) -> list[tuple[str, dict]]:
+    """(chain, prompt inputs) of the corpus requests planned by the SWITCH_TASK planner"""
+    cases = []
+    for body in corpus:
+        request = main.PlanRequest.model_validate(body)
+        planner_kind, _, inputs = main.prepare_plan(request)
+        if planner_kind == SWITCH_TASK:
+            cases.append((request.chain, inputs))
+    return cases
+
+
+def plan(lm, program, inputs) -> dict:
+    start = time.perf_counter()
+    try:
+        with dspy.context(lm=lm, track_usage=True):
+            prediction = program(**inputs)
+    except Exception as e:
+        return {"error": str(e), "latency": time.perf_counter() - start}
+    latency = time.perf_counter() - start
+    response = main.format_plan_response(prediction.action, prediction.parameters, prediction.action_description)
+    usage = prediction.get_lm_usage() or {}
+    return {
+        "action": response.action,
+        "parameters": response.parameters,
+        "completion_tokens": sum(model_usage.get("completion_tokens") or 0 for model_usage in usage.values()),
+        "latency": latency,
+    }
+
+
+def summarize(results) -> dict:
+    ok = [result for result in results if "error" not in result]
+    latencies = sorted(result["latency"] for result in ok)
+    return {
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "completion_tokens_mean": sum(result["completion_tokens"] for result in ok) / len(ok) if ok else None,
+        "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else None,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def run(args, lm, cases):
+    registries = {mode: PlannerRegistry(layout=main.prompt_layout, switch_task_mode=mode) for mode in SWITCH_TASK_MODES}
+    rows = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            {mode: pool.submit(plan, lm, registry.get(chain, SWITCH_TASK), inputs) for mode, registry in registries.items()}
+            for chain, inputs in cases
+        ]
+        for (chain, inputs), by_mode in zip(cases, futures):
+            rows.append({"chain": chain, "new_message": inputs["new_message"], **{mode: f.result() for mode, f in by_mode.items()}})
+
+    compared = [row for row in rows if "error" not in row["full"] and "error" not in row["lean"]]
+    same_action = [row for row in compared if row["full"]["action"] == row["lean"]["action"]]
+    same_plan = [row for row in same_action if row["full"]["parameters"] == row["lean"]["parameters"]]
+    report = {
+        "requests": len(rows),
+        "compared": len(compared),
+        "action_agreement": len(same_action) / len(compared) if compared else None,
+        "plan_agreement": len(same_plan) / len(compared) if compared else None,
+        "modes": {mode: summarize([row[mode] for row in rows]) for mode in SWITCH_TASK_MODES},
+    }
+
+    print(f"{report['requests']} SWITCH_TASK requests, {report['compared']} planned by both modes")
+    if compared:
+        print(f"action agreement {report['action_agreement']:.1%}, action and parameters agreement {report['plan_agreement']:.1%}")
+    print(f"{'mode':>6} {'ok':>5} {'errors':>6} {'out tokens':>10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, summary in report["modes"].items():
+        tokens = f"{summary['completion_tokens_mean']:.1f}" if summary["completion_tokens_mean"] is not None else "n/a"
+        mean = f"{summary['latency_mean_ms']:.1f}" if summary["latency_mean_ms"] is not None else "n/a"
+        print(
+            f"{mode:>6} {summary['ok']:>5} {summary['errors']:>6} {tokens:>10} {mean:>8} "
+            f"{summary['latency_p50_ms']:>8.1f} {summary['latency_p95_ms']:>8.1f}"
+        )
+    for row in [row for row in compared if row not in same_plan][: args.show]:
+        print(f"- {row['new_message'][:80]!r}: full {row['full']['action']} {row['full']['parameters']}, "
+              f"lean {row['lean']['action']} {row['lean']['parameters']}")
+    return report, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSONL file with one PlanRequest body per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="Planner calls in flight")
+    parser.add_argument("--show", type=int, default=10, help="Disagreements printed")
+    parser.add_argument("--output", help="Write the report and every request's plans as JSON")
+    parser.add_argument("--stub", action="store_true", help="Use the stub LM instead of the configured one")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    lm = stub_from_arguments(args) if args.stub else main.lm
+    if isinstance(lm, dspy.LM):
+        lm = lm.copy(cache=False)  # both modes must reach the LM on every run
+    report, rows = run(args, lm, switch_task_inputs(corpus))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "report": report, "rows": rows}, f, indent=2, default=str)
@@ -0,0 +1,62 @@
+"""
+Check that ordinary planner answers for the README example catalog validate without a repair LM call.
+Strict catalogs list every field as required, an answer that leaves out the nullable ones must only be coerced.
+Exits with status 1 when an answer needs a repair.
+
+    python -m benchmarks.validation
+"""
+import json
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+from agents.catalog import CatalogRegistry
+from agents.validation import InvalidPlan, PlanValidator
+
+README = Path(__file__).resolve().parent.parent / "README.md"
+
+# (action, parameters) as the LM answers them, only the fields the request talks about
+ANSWERS = [
+    ("EXECUTE_SWAP", {"inputTokenSymbol": "SOL", "outputTokenCA": "9DHe3pycTuymFk4H4bbPoAJ4hQrr2kaLDF6J6aAKpump", "inputTokenAmount": 0.1}),
+    ("EXECUTE_SWAP", {"inputTokenSymbol": "swarms", "outputTokenSymbol": "SOL", "inputTokenAmount": "4"}),
+    ("SEND_TOKEN", {"tokenSymbol": "SOL", "recipient": "5ZWj7a1f8tWkjBESHKgrLmXshuXxqeY9SYcfbshpAqPG", "amount": 0.00001}),
+    ("WALLET_PORTFOLIO", {}),
+    ("COPY_TRADE", {"targetAddress": "5ZWj7a1f8tWkjBESHKgrLmXshuXxqeY9SYcfbshpAqPG", "mode": "fixed", "copySell": True, "fixedAmount": 1}),
+]
+
+
+def readme_actions() -> list[dict]:
+    """Action list of the README example request"""
+    text = README.read_text()
+    example = text[text.index("### Example Request"):]
+    body = re.search(r"-d '(\{.*?\})'", example, re.S).group(1)
+    # the ANALYZE_TOKEN description escapes brackets, which JSON does not allow
+    return json.loads(body.replace("\\[", "[").replace("\\]", "]"))["actions"]
+
+
+class NoRepair:
+    """Stands in for the repair program, any call is a failure of this check"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        raise RuntimeError("repair called")
+
+
+if __name__ == "__main__":
+    catalog = CatalogRegistry().register(readme_actions())
+    validator = PlanValidator(repair=True)
+    validator.repair_program = NoRepair()
+    failed = 0
+    for action, parameters in ANSWERS:
+        try:
+            validated = validator.validate(catalog, action, parameters, "")
+            print(f"ok      {action} {validated}")
+        except InvalidPlan as e:
+            failed += 1
+            print(f"FAILED  {action}: {e}")
+    print(f"paths {dict(validator.paths)}, repair calls {validator.repair_program.calls}")
+    sys.exit(1 if failed or validator.repair_program.calls else 0)
@@ -1,8 +1,18 @@
 import os
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+import time
+import uuid
+import math
+from decimal import Decimal
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_serializer
 from typing import List, Any
 import dspy
+from dspy.adapters.utils import parse_value
+from dspy.streaming import StreamListener, StreamResponse
+from dspy.utils.exceptions import AdapterParseError
 from dotenv import load_dotenv
 import json
 from loguru import logger
@@ -10,31 +20,204 @@ import sys
 from datetime import datetime
 import pathlib
 
-from agents.planner import PlannerForFirstStep, PlannerWithSwitchTask, PlannerForLoop, SOL_BACKGROUND_PROMPT, BSC_BACKGROUND_PROMPT
-from agents.action import ACTION_LIST
+from agents.planner import PlannerRegistry, FIRST_STEP, SWITCH_TASK, LOOP, DEFAULT_LAYOUT, PREFIX_CACHE_LAYOUT
+from agents.catalog import CatalogRegistry, RESPONSE_ALIASES, SWITCH_TASK_ACTION
+from agents.executor import DeadlineExceeded, PlannerExecutor, PlannerSaturated
+from agents.admission import PRIORITIES, AdmissionController, RateLimited
+from agents.lm_pool import LMEndpointConfig, LMPool, LMUnavailable
+from agents.cascade import ModelCascade
+from agents.validation import InvalidPlan, PlanValidator, decimal_text
+from agents.cache import PlanCache, cache_key
+from agents.coalesce import RequestCoalescer
+from agents.compaction import PromptBudget, PromptCompactor, count_tokens, render_message
+from agents.router import FastPathRouter
+from agents.session import SessionConflict, SessionStore
+from agents.switch import SwitchTracker
+from agents.request_log import RequestLogger
+from agents.metrics import PlanMetrics, RequestTimer, StageTimer, stage_labels
 
 # Load environment variables
 load_dotenv()
 
 # Configure logger
+# "full" logs every request payload on the request path, "structured" logs a compact record per request
+# and a sampled, size-capped payload from a background thread
+log_mode = os.getenv("LOG_MODE", "full").lower()
 log_dir = "log"
 pathlib.Path(log_dir).mkdir(exist_ok=True)
 log_file = f"{log_dir}/{{time:YYYY-MM-DD_HH}}.log"  # Use loguru's time formatting
 logger.remove()  # Remove default logger
-logger.add(sys.stderr, level="INFO")  # Add stderr logger
-logger.add(log_file, rotation="1h", level="INFO")  # Use "1h" for hourly rotation
+logger.add(sys.stderr, level="INFO", enqueue=log_mode == "structured")  # Add stderr logger
+logger.add(log_file, rotation="1h", level="INFO", enqueue=log_mode == "structured")  # Use "1h" for hourly rotation
+
+request_logger = None
+if log_mode == "structured":
+    request_logger = RequestLogger(
+        sample_rate=float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01")),
+        max_field_chars=int(os.getenv("LOG_MAX_FIELD_CHARS", "2000")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    )
+
+# Set once the planners and the LM client are initialized, cleared when the worker starts draining
+ready = False
+
+
+def warm_up():
+    """Load what the first request would otherwise pay for, safe to run before forking workers"""
+    import litellm  # noqa: F401  dspy imports it lazily on the first LM call, which takes seconds
+
+    count_tokens("warm up")  # loads the token encoding used by prompt compaction
+    adapter = dspy.ChatAdapter()
+    for chain in planners.chains:
+        for kind in (FIRST_STEP, SWITCH_TASK, LOOP):
+            signature = planners.get(chain, kind).signature
+            adapter.format(signature, demos=[], inputs={name: "" for name in signature.input_fields})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global ready
+    await asyncio.to_thread(warm_up)
+    ready = True
+    logger.info(f"planner ready, pid {os.getpid()}")
+    yield
+    # uvicorn has stopped accepting requests and waited for in-flight ones before shutting down the lifespan
+    ready = False
+    executor.shutdown(wait=True)
+    if request_logger is not None:
+        request_logger.close()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Action Planner API",
     description="API that accepts chat history and returns an action",
+    lifespan=lifespan,
 )
+app.add_middleware(RequestTimer)
+
+# Per-stage latency, token, action and error metrics, served by GET /metrics
+metrics = PlanMetrics()
 
 # Initialize language model
 model = "openai/gpt-4o"
 lm = dspy.LM(model=model, api_key=os.getenv("OPENAI_API_KEY"))
 
-dspy.configure(lm=lm)
+# Optional pool of LM endpoints (JSON list of LMEndpointConfig) with failover, circuit breaking and hedging
+lm_pool = None
+if os.getenv("LM_POOL"):
+    lm_pool = LMPool.from_config(
+        [LMEndpointConfig(**entry) for entry in json.loads(os.getenv("LM_POOL"))],
+        failure_threshold=int(os.getenv("LM_CIRCUIT_FAILURES", "5")),
+        cooldown=float(os.getenv("LM_CIRCUIT_COOLDOWN_SECONDS", "30")),
+        hedge=os.getenv("LM_HEDGE_ENABLED", "false").lower() == "true",
+        hedge_quantile=float(os.getenv("LM_HEDGE_QUANTILE", "0.95")),
+        hedge_min_delay=float(os.getenv("LM_HEDGE_MIN_DELAY_SECONDS", "0.05")),
+        hedge_max_delay=float(os.getenv("LM_HEDGE_MAX_DELAY_SECONDS", "2")),
+    )
+    lm = lm_pool
+
+# Optional small model that plans first for the listed planner kinds, escalating to the main LM when its plan fails checks
+cascade = None
+if os.getenv("CASCADE_MODEL"):
+    cascade = ModelCascade(
+        dspy.LM(
+            model=os.getenv("CASCADE_MODEL"),
+            api_key=os.getenv("CASCADE_API_KEY", os.getenv("OPENAI_API_KEY")),
+            api_base=os.getenv("CASCADE_API_BASE") or None,
+        ),
+        kinds=[kind.strip() for kind in os.getenv("CASCADE_PLANNER_KINDS", LOOP).split(",") if kind.strip()],
+        samples=int(os.getenv("CASCADE_SAMPLES", "1")),
+    )
+
+# track_usage exposes token counts on each prediction, StageTimer times prompt formatting, the LM call and parsing
+dspy.configure(lm=lm, track_usage=True, callbacks=[StageTimer(metrics)])
+
+# Batch items planned at the same time by one /plan/batch call, each still takes an executor slot
+batch_max_concurrency = int(os.getenv("PLAN_BATCH_MAX_CONCURRENCY", os.getenv("PLANNER_MAX_CONCURRENCY", "32")))
+
+# Planner programs for every (chain, planner kind), built once and shared by all requests
+# "prefix_cache" puts the static instructions and catalog first and the per-request inputs last, for upstream prompt caching
+prompt_layout = os.getenv("PROMPT_LAYOUT", DEFAULT_LAYOUT).lower()
+planners = PlannerRegistry(
+    layout=prompt_layout,
+    # "lean" replaces the prose reasoning of the SWITCH_TASK planner with short flags, see benchmarks/switch_task_mode.py
+    switch_task_mode=os.getenv("PLANNER_SWITCH_TASK_MODE", "full").lower(),
+)
+
+# Registered action catalogs with their prompt rendering, the built-in ACTION_LIST is the "default" catalog
+catalogs = CatalogRegistry(
+    max_entries=int(os.getenv("CATALOG_MAX_ENTRIES", "1024")),
+    max_inline_entries=int(os.getenv("CATALOG_MAX_INLINE_ENTRIES", "1024")),
+    canonical=prompt_layout == PREFIX_CACHE_LAYOUT,
+)
+
+# Token budget for chat history and past steps per planner kind, 0 keeps the full history
+compactor = PromptCompactor({
+    kind: PromptBudget(
+        max_tokens=int(os.getenv(f"PROMPT_TOKEN_BUDGET_{kind.upper()}", "0")),
+        keep_recent_turns=int(os.getenv("PROMPT_KEEP_RECENT_TURNS", "4")),
+        keep_recent_steps=int(os.getenv("PROMPT_KEEP_RECENT_STEPS", "2")),
+        turn_max_tokens=int(os.getenv("PROMPT_TURN_MAX_TOKENS", "200")),
+        step_result_max_tokens=int(os.getenv("PROMPT_STEP_RESULT_MAX_TOKENS", "300")),
+    )
+    for kind in (FIRST_STEP, SWITCH_TASK, LOOP)
+})
+
+# Rule based fast path for unambiguous intents, "on" answers without the LM, "shadow" only compares with it
+router = FastPathRouter(
+    mode=os.getenv("ROUTER_MODE", "off").lower(),
+    kinds=[kind.strip() for kind in os.getenv("ROUTER_PLANNER_KINDS", FIRST_STEP).split(",") if kind.strip()],
+)
+
+def action_names(text: str) -> list[str]:
+    return [name.strip() for name in text.split(",") if name.strip()]
+
+
+# Actions that move funds or start tasks, including the swap name the background prompts use (EXECUTE_SWAP)
+SIDE_EFFECT_ACTIONS = action_names(
+    os.getenv("SIDE_EFFECT_ACTIONS", "SWAP_TOKEN,EXECUTE_SWAP,SEND_TOKEN,COPY_TRADE,AUTO_TASK,CREATE_TOKEN,CLAIM_AIRDROP")
+)
+
+# Opt-in cache of plan decisions, side-effecting actions are never served from it
+plan_cache = None
+if os.getenv("PLAN_CACHE_ENABLED", "false").lower() == "true":
+    plan_cache = PlanCache(
+        max_bytes=int(os.getenv("PLAN_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "300")),
+        bypass_actions=action_names(os.getenv("PLAN_CACHE_BYPASS_ACTIONS", ",".join(SIDE_EFFECT_ACTIONS))),
+        path=os.getenv("PLAN_CACHE_PATH") or None,
+    )
+
+# Identical plan requests in flight share one planner call, and get its answer for a short while after it completed
+coalescer = None
+if os.getenv("PLAN_COALESCE_ENABLED", "false").lower() == "true":
+    coalescer = RequestCoalescer(window=float(os.getenv("PLAN_COALESCE_WINDOW_SECONDS", "2")))
+
+# Task switches resolved in the same call, with the client round trip they save
+switches = SwitchTracker()
+
+# Planned parameters are validated against the action schema, cheap mistakes coerced and the rest repaired by one small LM call
+plan_validator = None
+if os.getenv("PLAN_VALIDATION_ENABLED", "true").lower() == "true":
+    plan_validator = PlanValidator(repair=os.getenv("PLAN_REPAIR_ENABLED", "true").lower() == "true")
+
+# The cascade checks the small model's plan against the action schema even when validating responses is off
+cascade_checker = (plan_validator or PlanValidator(repair=False)) if cascade is not None else None
+
+# Per-tenant rate limits, priority classes and deadlines, applied before a request waits for a planner slot
+admission = AdmissionController(
+    rate=float(os.getenv("RATE_LIMIT_RPS", "0")),
+    burst=float(os.getenv("RATE_LIMIT_BURST", "0")),
+    priority_actions=action_names(os.getenv("PRIORITY_ACTIONS", ",".join(SIDE_EFFECT_ACTIONS))),
+    default_timeout=float(os.getenv("PLAN_DEFAULT_TIMEOUT_SECONDS", "0")),
+)
+
+# LM calls are blocking, run them on a bounded thread pool and reject with 503 once saturated
+executor = PlannerExecutor(
+    max_concurrency=int(os.getenv("PLANNER_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("PLANNER_MAX_QUEUE", "64")),
+)
 
 class Media(BaseModel):
     id: str
@@ -59,169 +242,785 @@ class Step(BaseModel):
 
 
 class PlanRequest(BaseModel):
-    chat_history: List[ChatMessage]
+    chat_history: List[ChatMessage]  # with session_id, only the messages from history_start on
     task_definition: str
-    actions: list[dict | None]
-    past_steps: list[Step]
+    actions: list[dict | None] | None = None  # full action schemas, or register them once and send catalog_id
+    past_steps: list[Step]  # with session_id, only the steps from steps_start on
     switched_task: bool
     chain: str = "solana"
+    catalog_id: str | None = None  # id returned by POST /catalogs, "default" for the built-in actions
+    session_id: str | None = None  # keep the history server side, see SessionStore.update
+    resolve_switch_task: bool = False  # on SWITCH_TASK, also plan the first step of the new task as `next`
+    history_start: int = Field(0, ge=0)
+    steps_start: int = Field(0, ge=0)
+
+
+class CatalogRequest(BaseModel):
+    actions: list[dict | None]
+
+
+class CatalogResponse(BaseModel):
+    catalog_id: str
+    actions: list[str]
 
 
 class PlanResponse(BaseModel):
     action: str
     parameters: dict[str, Any]
     explanation: str
+    next: "PlanResponse | None" = None  # first step of the new task, for a resolved SWITCH_TASK
+
+    @model_serializer(mode="wrap")
+    def omit_empty_next(self, handler):
+        # keep the response shape of clients that do not resolve switches, in /plan, batches, streams and the cache
+        data = handler(self)
+        if data.get("next") is None:
+            data.pop("next", None)
+        return data
+
+
+class PlanBatchRequest(BaseModel):
+    requests: list[PlanRequest]
+
+
+class PlanBatchItem(BaseModel):
+    status_code: int
+    response: PlanResponse | None = None
+    error: str | None = None
+
+
+class PlanBatchResponse(BaseModel):
+    results: list[PlanBatchItem]  # same order as the requests
+
+# Optional server-side sessions, clients with a session_id send only new messages and steps
+sessions = None
+if os.getenv("SESSIONS_ENABLED", "false").lower() == "true":
+    sessions = SessionStore(
+        ChatMessage,
+        Step,
+        max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024))),
+        ttl=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+        path=os.getenv("SESSION_STORE_PATH") or None,
+    )
 
-WRAP_UP_ACTION = {"name": "WRAP_UP",
-            "strict": True,
-            "additionalProperties": False,
-            "description": """Wrap up the process for previous steps when the user's request is completely executed or it is unable to be completed.
-# Guideline
-1. Generate a message to the user utilizing the information from previous steps.""",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "message": {
-                        "type": "string",
-                        "description": "The message to wrap up the process or to reply to the user's message"
-                    }}}}
-
-GENERAL_CHAT_ACTION = {"name": "GENERAL_CHAT",
-            "strict": True,
-            "additionalProperties": False,
-            "description": """Reply to the user's message. This action is triggered when the user's message is not related to the crypto market.""",
-            "parameters": {
-                "type": "object",
-                "properties": {"message": {"type": "string", "description": "The message to reply to the user"}}}}
-
-SWITCH_TASK_ACTION = {"name": "SWITCH_TASK",
-            "strict": True,
-            "additionalProperties": False,
-            "description": """Generate a new task definition. This action is triggered when the current task definition does not match the user's latest message.""",
-            "parameters": {
-                "type": "object",
-                "properties": {"newTaskDefinition": {"type": "string", "description": "new task definition"}}}}
 
 def convert_scientific_to_decimal(obj):
     if isinstance(obj, dict):
         return {key: convert_scientific_to_decimal(value) for key, value in obj.items()}
     elif isinstance(obj, list):
         return [convert_scientific_to_decimal(item) for item in obj]
-    elif isinstance(obj, float):
+    elif isinstance(obj, (float, Decimal)):
         # Convert scientific notation to decimal format
-        return format(obj, 'f').rstrip('0').rstrip('.')
+        return decimal_text(obj)
     return obj
 
-def modify_dspy_signature(chain):
-    dspy_signature_list = [PlannerForFirstStep, PlannerWithSwitchTask, PlannerForLoop]
-    
-    if chain == "solana":
-        BACKGROUND_PROMPT = SOL_BACKGROUND_PROMPT
-    elif chain == "bsc":
-        BACKGROUND_PROMPT = BSC_BACKGROUND_PROMPT
+def prepare_plan(request: PlanRequest):
+    """Pick the planner kind for the request and build its prompt inputs, returns (planner_kind, catalog, inputs)"""
+    started = time.perf_counter()
+    task_definition = request.task_definition
+    if request.session_id is not None:
+        if sessions is None:
+            raise HTTPException(status_code=400, detail="Sessions are disabled, send the full chat history without session_id")
+        try:
+            session = sessions.update(
+                request.session_id, request.history_start, request.chat_history, request.steps_start, request.past_steps
+            )
+        except SessionConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if not session.messages:
+            raise HTTPException(status_code=422, detail=f"Session {request.session_id} has no messages")
+        # copies, a later request for the same session changes the session's lists while this one is queued
+        messages, steps, history_lines = session.messages, list(session.steps), session.lines[:-1]
+    else:
+        messages, steps = request.chat_history, request.past_steps
+        history_lines = [render_message(msg) for msg in messages[:-1]]
+    last_message = messages[-1]
+    if last_message.role == "user":
+        new_message = last_message.content
+        if last_message.attachments:
+            new_message += f" (Attachment: {last_message.attachments[0].url})"
+    else:
+        new_message = ""
+    last_step = steps[-1] if steps else None
+    switched_task = request.switched_task
+
+    if switched_task:
+        planner_kind = FIRST_STEP
+    elif new_message:
+        planner_kind = SWITCH_TASK
     else:
-        BACKGROUND_PROMPT = SOL_BACKGROUND_PROMPT        
-        logger.warning(f"Invalid chain: {chain}, using Solana background prompt")
+        planner_kind = LOOP
 
-    for dspy_signature in dspy_signature_list:
-        # Store original doc if not already stored
-        if not hasattr(dspy_signature, '_original_doc'):
-            dspy_signature._original_doc = dspy_signature.__doc__ or ""
-        
-        # Reset doc to original + background prompt
-        dspy_signature.__doc__ = f"{BACKGROUND_PROMPT}{dspy_signature._original_doc}"
+    compacted_lines, past_steps, _ = compactor.compact(planner_kind, history_lines, steps)
+    if request.session_id is not None and compacted_lines is history_lines:
+        chat_history_str = session.history_text  # rendered once as the messages arrived
+    else:
+        chat_history_str = "".join(compacted_lines)
 
-    return dspy_signature_list
+    if request.catalog_id is not None:
+        catalog = catalogs.get(request.catalog_id)
+        if catalog is None:
+            raise HTTPException(status_code=404, detail=f"Unknown catalog_id: {request.catalog_id}, register it with POST /catalogs")
+    elif request.actions is not None:
+        try:
+            catalog = catalogs.register(request.actions, inline=True)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    else:
+        catalog = catalogs.default
 
-@app.post("/plan", response_model=PlanResponse)
-async def plan(request: PlanRequest):
-    CUSTOM_PLANNER_FOR_FIRST_STEP, CUSTOM_PLANNER_WITH_SWITCH_TASK, CUSTOM_PLANNER_FOR_LOOP = modify_dspy_signature(request.chain)
-    try:
+    if planner_kind == SWITCH_TASK:
+        inputs = dict(
+            chat_history=chat_history_str,
+            new_message=new_message,
+            past_steps=past_steps,
+            last_step=last_step,
+            task_definition=task_definition,
+            available_action=catalog.prompt_with_switch_task,
+        )
+    elif planner_kind == LOOP:
+        inputs = dict(
+            chat_history=chat_history_str,
+            task_definition=task_definition,
+            past_steps=past_steps,
+            available_action=catalog.prompt,
+        )
+    else:
+        inputs = dict(
+            chat_history=chat_history_str,
+            new_message=new_message,
+            task_definition=task_definition,
+            available_action=catalog.prompt,
+        )
+    metrics.observe_stage("prepare", time.perf_counter() - started, (request.chain, planner_kind))
+    return planner_kind, catalog, inputs
+
+
+def plan_cache_key(request: PlanRequest, planner_kind, catalog, inputs):
+    return cache_key(
+        request.chain,
+        planner_kind,
+        catalog.id,
+        {name: value for name, value in inputs.items() if name != "available_action"},
+    )
+
+
+def format_plan_response(action, parameters, action_description) -> PlanResponse:
+    # for LAUNCH_TOKEN, change the action name back to CREATE_TOKEN
+    action = RESPONSE_ALIASES.get(action, action)
+    return PlanResponse(
+        action=action.strip('"'),
+        # Convert parameters from scientific notation to decimal
+        parameters=convert_scientific_to_decimal(parameters),
+        explanation=action_description.strip('"'),
+    )
+
+
+def log_request(request_id, request: PlanRequest):
+    if request_logger is None:
         logger.info(f"request: {json.dumps(request.dict(), default=str)}")
-        task_definition = request.task_definition
-        chat_history = request.chat_history[:-1]
-        last_message = request.chat_history[-1]
-        if last_message.role == "user":
-            new_message = last_message.content
-            if last_message.attachments:
-                new_message += f" (Attachment: {last_message.attachments[0].url})"
-        else:
-            new_message = ""
-        past_steps = request.past_steps
-        last_step = request.past_steps[-1] if request.past_steps else None
-        switched_task = request.switched_task
-
-        chat_history_str = ""
-        for msg in chat_history:
-            chat_history_str += f"{msg.role}: {msg.content}"
-            if msg.attachments:
-                chat_history_str += f" (Attachment: {msg.attachments[0].url})"
-            chat_history_str += "\n"
-            
-        actions = [action for action in request.actions if action is not None] + [WRAP_UP_ACTION, GENERAL_CHAT_ACTION]
-        
-        # for CREATE_TOKEN, change the action name to LAUNCH_TOKEN
-        for action in actions:
-            if action["name"] == "CREATE_TOKEN":
-                action["name"] = "LAUNCH_TOKEN"
-
-        if switched_task == False:
-            if new_message:
-                actions.append(SWITCH_TASK_ACTION)
-                plan_action = dspy.Predict(CUSTOM_PLANNER_WITH_SWITCH_TASK)
-                response = plan_action(
-                    chat_history=chat_history_str,
-                    new_message=new_message,
-                    past_steps=past_steps,
-                    last_step=last_step,
-                    task_definition=task_definition,
-                    available_action=actions,
-                    
-                )
-            else:
-                plan_action = dspy.Predict(CUSTOM_PLANNER_FOR_LOOP)
-                response = plan_action(
-                    chat_history=chat_history_str,
-                    task_definition=task_definition,
-                    past_steps=past_steps,
-                    available_action=actions,  
-                )
+    else:
+        request_logger.payload(request_id, request)
+
+
+def finish_request(request_id, endpoint, request: PlanRequest, status_code, start, trace):
+    """Per-request metrics, and the compact per-request record in structured log mode"""
+    if status_code != 200:
+        metrics.errors.inc(endpoint, str(status_code))
+    if "action" in trace:
+        metrics.actions.inc(trace["action"], trace["source"])
+    if "planner_kind" in trace and endpoint != "/plan/batch":
+        metrics.observe_stage("total", time.perf_counter() - start, (request.chain, trace["planner_kind"]))
+    if request_logger is not None:
+        request_logger.record(
+            request_id,
+            endpoint=endpoint,
+            chain=request.chain,
+            status=status_code,
+            total_ms=round((time.perf_counter() - start) * 1000, 1),
+            **trace,
+        )
+
+
+# Reasoning outputs of the full and lean SWITCH_TASK planners, logged and otherwise unused
+SWITCH_TASK_REASONING = ("is_same_task", "should_repeat_last_step", "summary_of_past_steps", "same_task", "last_step_status", "task_done")
+
+
+def log_plan(planner_kind, response):
+    if request_logger is not None:
+        return
+    # Complex situation where we have to determine if the task is the same as the user's latest message, and if the last step is pending
+    if planner_kind == SWITCH_TASK:
+        for name in SWITCH_TASK_REASONING:
+            if name in response:
+                logger.info(f"{name}: {response[name]}")
+
+    logger.info(f"action: {response.action}\n parameters: {response.parameters}\n action_description: {response.action_description}")
+
+
+def request_text(inputs) -> str:
+    """What the user asked for, the context of a parameter repair"""
+    return inputs.get("new_message") or inputs["task_definition"]
+
+
+def route_plan(request: PlanRequest, planner_kind, catalog, inputs):
+    """Fast path decision as (rule, PlanResponse), or None when no rule is confident"""
+    route = router.route(request.chain, planner_kind, inputs.get("new_message", ""), inputs["task_definition"], catalog)
+    if route is None:
+        return None
+    rule, action, parameters, explanation = route
+    return rule, format_plan_response(action, parameters, explanation)
+
+
+async def execute_plan(
+    request: PlanRequest, planner_kind, catalog, inputs, program=None, trace=None, priority=PRIORITIES["normal"], deadline=None
+) -> PlanResponse:
+    """
+    Plan one prepared request from the fast path, the plan cache or the LM; `trace` collects where it came from.
+    The LM call waits for a planner slot by `priority` and is abandoned with DeadlineExceeded at `deadline`.
+    """
+    trace = trace if trace is not None else {}
+    trace["planner_kind"] = planner_kind
+    labels = (request.chain, planner_kind)
+    routed = route_plan(request, planner_kind, catalog, inputs)
+    if routed is not None and router.mode == "on":
+        rule, plan_response = routed
+        trace.update(source="fast_path", rule=rule, action=plan_response.action)
+        if request_logger is None:
+            logger.info(f"fast path ({rule}), action: {plan_response.action}\n parameters: {plan_response.parameters}")
+        return plan_response
+
+    if plan_cache is not None:
+        key = plan_cache_key(request, planner_kind, catalog, inputs)
+        cached = plan_cache.get(key)
+        if cached is not None:
+            if request_logger is None:
+                logger.info(f"plan cache hit, action: {cached['action']}")
+            trace.update(source="cache", action=cached["action"])
+            return PlanResponse(**cached)
+
+    program = program or planners.get(request.chain, planner_kind)
+    lm_start = time.perf_counter()
+
+    allow_switch_task = planner_kind == SWITCH_TASK
+
+    def call(**inputs):
+        metrics.observe_stage("queue", time.perf_counter() - lm_start)
+        # the LM request times out with the deadline, so an abandoned call does not hold its slot much longer
+        config = {"timeout": max(deadline - time.perf_counter(), 0.001)} if deadline is not None else {}
+        if cascade is not None and cascade.applies(planner_kind):
+            response, model_tier = cascade.plan(
+                planner_kind,
+                program,
+                inputs,
+                lambda p: cascade_checker.check(catalog, p.action, p.parameters, allow_switch_task)[1],
+                config,
+            )
         else:
-            plan_action = dspy.Predict(CUSTOM_PLANNER_FOR_FIRST_STEP)
-            response = plan_action(     
-                chat_history=chat_history_str,
-                new_message=new_message,
-                task_definition=task_definition,
-                available_action=actions,
+            main_start = time.perf_counter()
+            response, model_tier = program(**inputs, config=config), "main"
+            if cascade is not None:
+                cascade.observe_main(planner_kind, time.perf_counter() - main_start)
+        parameters = response.parameters
+        if plan_validator is not None:
+            parameters = plan_validator.validate(catalog, response.action, parameters, request_text(inputs), allow_switch_task)
+        return response, model_tier, parameters
+
+    token = stage_labels.set(labels)
+    try:
+        response, model_tier, parameters = await executor.run(call, priority=priority, deadline=deadline, **inputs)
+    finally:
+        stage_labels.reset(token)
+    trace.update(source="lm", model=model_tier, lm_ms=round((time.perf_counter() - lm_start) * 1000, 1))
+    metrics.observe_usage(response.get_lm_usage(), labels)
+    log_plan(planner_kind, response)
+
+    convert_start = time.perf_counter()
+    plan_response = format_plan_response(response.action, parameters, response.action_description)
+    metrics.observe_stage("convert", time.perf_counter() - convert_start, labels)
+    if routed is not None:
+        rule, routed_response = routed
+        router.compare(rule, routed_response.action, routed_response.parameters, plan_response)
+    if plan_cache is not None:
+        plan_cache.put(key, plan_response.model_dump())
+    trace["action"] = plan_response.action
+    return plan_response
+
+
+async def plan_once(request: PlanRequest, planner_kind, catalog, inputs, program=None, trace=None, priority=PRIORITIES["normal"], deadline=None):
+    """
+    execute_plan, shared by identical requests (gateway retries, double submits) so they get the same decision.
+    Requests share a call only within a priority class, and each one waits for it until its own deadline:
+    when the shared call ran out of another request's deadline, a request with time left plans again.
+    """
+    if coalescer is None:
+        return await execute_plan(request, planner_kind, catalog, inputs, program, trace, priority, deadline)
+    key = (cache_key(request.chain, request), priority)
+    while True:
+        timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+        try:
+            plan_response, shared = await coalescer.run(
+                key, lambda: execute_plan(request, planner_kind, catalog, inputs, program, trace, priority, deadline), timeout
             )
-        
-        
-        
-        # for LAUNCH_TOKEN, change the action name to CREATE_TOKEN
-        if response.action == "LAUNCH_TOKEN":
-            response.action = "CREATE_TOKEN"
-        
-        # Complex situation where we have to determine if the task is the same as the user's latest message, and if the last step is pending
-        if switched_task == False and new_message:
-            logger.info(f"is_same_task: {response.is_same_task}")
-            logger.info(f"should_repeat_last_step: {response.should_repeat_last_step}")
-            logger.info(f"summary_of_past_steps: {response.summary_of_past_steps}")
-        
-        logger.info(f"action: {response.action}\n parameters: {response.parameters}\n action_description: {response.action_description}")
-        
-        # Convert parameters from scientific notation to decimal
-        formatted_parameters = convert_scientific_to_decimal(response.parameters)
-        
-        return PlanResponse(
-            action=response.action.strip('"'),
-            parameters=formatted_parameters,
-            explanation=response.action_description.strip('"'),
+            break
+        except TimeoutError:
+            if deadline is None or time.perf_counter() < deadline:
+                raise
+            raise DeadlineExceeded("deadline exceeded while waiting for an identical request")
+        except DeadlineExceeded:
+            if deadline is not None and time.perf_counter() >= deadline:
+                raise
+    if shared and trace is not None:
+        trace.update(source="coalesced", action=plan_response.action)
+    return plan_response
+
+
+def switch_key(request: PlanRequest):
+    """Same for a SWITCH_TASK request and the switched_task request that follows it"""
+    return request.session_id or cache_key(request.chain, request.chat_history)
+
+
+async def resolve_switch_task(request: PlanRequest, switch_response: PlanResponse, trace, priority, deadline) -> PlanResponse:
+    """Plan the first step of the new task right away, the SWITCH_TASK answer carries it as `next`"""
+    new_task = switch_response.parameters.get("newTaskDefinition")
+    if not new_task:
+        return switch_response
+    follow_up = request.model_copy(update={"task_definition": new_task, "switched_task": True, "resolve_switch_task": False})
+    started = time.perf_counter()
+    next_trace = {}
+    try:
+        planner_kind, catalog, inputs = prepare_plan(follow_up)
+        next_response = await plan_once(follow_up, planner_kind, catalog, inputs, trace=next_trace, priority=priority, deadline=deadline)
+    except Exception as e:
+        switches.record_failed()
+        logger.warning(f"Could not plan the switched task, the client plans it: {e}")
+        return switch_response
+    saved = switches.record_resolved()
+    metrics.actions.inc(next_response.action, next_trace["source"])
+    trace.update(
+        next_action=next_response.action,
+        next_source=next_trace["source"],
+        next_ms=round((time.perf_counter() - started) * 1000, 1),
+        switch_saved_ms=round(saved * 1000, 1) if saved is not None else None,
+    )
+    return switch_response.model_copy(update={"next": next_response})
+
+
+async def finish_switch_task(request: PlanRequest, planner_kind, plan_response: PlanResponse, trace, priority, deadline) -> PlanResponse:
+    """A SWITCH_TASK answer gets its `next` step when the request asks for it, otherwise the client's follow-up is expected"""
+    if planner_kind == SWITCH_TASK and plan_response.action == SWITCH_TASK_ACTION["name"]:
+        if request.resolve_switch_task:
+            return await resolve_switch_task(request, plan_response, trace, priority, deadline)
+        switches.expect_follow_up(switch_key(request))
+    return plan_response
+
+
+def tenant(x_tenant_id: str | None, x_agent_id: str | None) -> str | None:
+    """Rate limit key of a request, None when the client sends neither header"""
+    return x_tenant_id or x_agent_id
+
+
+def error_status(e: Exception):
+    """HTTP status and detail for an exception raised while planning"""
+    if isinstance(e, HTTPException):
+        return e.status_code, e.detail
+    if isinstance(e, (PlannerSaturated, LMUnavailable)):
+        return 503, str(e)
+    if isinstance(e, RateLimited):
+        return 429, str(e)
+    if isinstance(e, DeadlineExceeded):
+        return 504, str(e)
+    if isinstance(e, (InvalidPlan, AdapterParseError)):
+        return 502, str(e)
+    return 500, str(e)
+
+
+@app.post("/plan", response_model=PlanResponse)
+async def plan(
+    request: PlanRequest,
+    response: Response,
+    http_request: Request,
+    x_request_id: str | None = Header(None),
+    x_tenant_id: str | None = Header(None),
+    x_agent_id: str | None = Header(None),
+    x_priority: str | None = Header(None),
+    x_deadline_ms: str | None = Header(None),
+):
+    request_id = x_request_id or uuid.uuid4().hex
+    response.headers["X-Request-ID"] = request_id
+    parsed_at = time.perf_counter()
+    start = http_request.scope.get("received_at", parsed_at)
+    trace = {}
+    status_code = 200
+    metrics.in_flight.inc("/plan")
+    try:
+        admission.admit(tenant(x_tenant_id, x_agent_id))
+        deadline = admission.deadline(x_deadline_ms, start)
+        log_request(request_id, request)
+        if request.switched_task:
+            switches.observe_follow_up(switch_key(request), start)
+        planner_kind, catalog, inputs = prepare_plan(request)
+        metrics.observe_stage("parse", parsed_at - start, (request.chain, planner_kind))
+        priority = admission.classify(x_priority, planner_kind, inputs)
+        plan_response = await plan_once(request, planner_kind, catalog, inputs, trace=trace, priority=priority, deadline=deadline)
+        return await finish_switch_task(request, planner_kind, plan_response, trace, priority, deadline)
+
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    except PlannerSaturated as e:
+        status_code = 503
+        logger.warning(f"Rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except LMUnavailable as e:
+        status_code = 503
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after or 5))})
+    except RateLimited as e:
+        status_code = 429
+        logger.warning(f"Rejected: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except DeadlineExceeded as e:
+        # the client has given up, answer right away instead of planning for nobody
+        status_code = 504
+        logger.warning(f"Abandoned: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except (InvalidPlan, AdapterParseError) as e:
+        # the LM answer is unusable, tell it apart from our own failures
+        status_code = 502
+        logger.error(f"Invalid plan: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        status_code = 500
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.in_flight.dec("/plan")
+        finish_request(request_id, "/plan", request, status_code, start, trace)
+
+
+@app.post("/plan/batch", response_model=PlanBatchResponse)
+async def plan_batch(
+    batch: PlanBatchRequest,
+    x_request_id: str | None = Header(None),
+    x_tenant_id: str | None = Header(None),
+    x_agent_id: str | None = Header(None),
+    x_priority: str | None = Header(None),
+    x_deadline_ms: str | None = Header(None),
+):
+    """
+    Plan many requests in one call. Items are grouped by (chain, planner kind) so each group shares one program,
+    run concurrently within the batch budget on the shared executor, and fail independently.
+    Every item counts against the tenant rate limit, and items are low priority unless X-Priority says otherwise.
+    """
+    batch_id = x_request_id or uuid.uuid4().hex
+    start = time.perf_counter()
+    try:
+        admission.admit(tenant(x_tenant_id, x_agent_id), cost=len(batch.requests))
+    except RateLimited as e:
+        logger.warning(f"Rejected: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    deadline = admission.deadline(x_deadline_ms, start)
+    results = [None] * len(batch.requests)
+    groups = {}
+    for index, request in enumerate(batch.requests):
+        try:
+            log_request(f"{batch_id}-{index}", request)
+            if request.switched_task:
+                switches.observe_follow_up(switch_key(request), start)
+            planner_kind, catalog, inputs = prepare_plan(request)
+        except Exception as e:
+            status_code, detail = error_status(e)
+            results[index] = PlanBatchItem(status_code=status_code, error=detail)
+            finish_request(f"{batch_id}-{index}", "/plan/batch", request, status_code, start, {})
+            continue
+        groups.setdefault((request.chain, planner_kind), []).append((index, request, catalog, inputs))
+
+    budget = asyncio.Semaphore(batch_max_concurrency)
+
+    async def run_item(index, request, planner_kind, catalog, inputs, program):
+        trace = {}
+        priority = admission.classify(x_priority, planner_kind, inputs, default="low")
+        async with budget:
+            try:
+                plan_response = await plan_once(request, planner_kind, catalog, inputs, program, trace, priority, deadline)
+                results[index] = PlanBatchItem(
+                    status_code=200,
+                    response=await finish_switch_task(request, planner_kind, plan_response, trace, priority, deadline),
+                )
+            except Exception as e:
+                status_code, detail = error_status(e)
+                logger.error(f"Error in batch request {index}: {detail}")
+                results[index] = PlanBatchItem(status_code=status_code, error=detail)
+        finish_request(f"{batch_id}-{index}", "/plan/batch", request, results[index].status_code, start, trace)
+
+    tasks = []
+    for (chain, planner_kind), items in groups.items():
+        program = planners.get(chain, planner_kind)
+        for index, request, catalog, inputs in items:
+            tasks.append(run_item(index, request, planner_kind, catalog, inputs, program))
+    metrics.in_flight.inc("/plan/batch")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        metrics.in_flight.dec("/plan/batch")
+
+    logger.info(f"batch of {len(results)}: {sum(item.status_code == 200 for item in results)} planned, {len(groups)} groups")
+    return PlanBatchResponse(results=results)
+
+
+def sse_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def parse_streamed_action(fields, catalog, planner_kind):
+    """
+    Parsed action and parameters from the streamed field text, None while they cannot be parsed yet
+    or when they need more than a cheap coercion, the final event then carries the repaired plan
+    """
+    try:
+        parameters = parse_value(fields["parameters"].strip(), dict[str, Any])
+    except Exception:
+        return None
+    if not isinstance(parameters, dict):
+        return None
+    if plan_validator is not None:
+        parameters, problem = plan_validator.check(catalog, fields["action"], parameters, planner_kind == SWITCH_TASK)
+        if problem is not None:
+            return None
+    response = format_plan_response(fields["action"].strip(), parameters, "")
+    return {"action": response.action, "parameters": response.parameters}
+
+
+async def stream_plan_events(request: PlanRequest, planner_kind, catalog, inputs, key, request_id, start):
+    """
+    Server-sent events for one plan: an `action` event as soon as the action and its parameters are decoded,
+    then a `final` event with the full PlanResponse, or an `error` event. The executor slot is released by PlanEventStream.
+    """
+    trace = {"planner_kind": planner_kind}
+    labels = (request.chain, planner_kind)
+    status_code = 200
+    try:
+        routed = route_plan(request, planner_kind, catalog, inputs)
+        if routed is not None and router.mode == "on":
+            rule, plan_response = routed
+            if request_logger is None:
+                logger.info(f"fast path ({rule}), action: {plan_response.action}\n parameters: {plan_response.parameters}")
+            trace.update(source="fast_path", rule=rule, action=plan_response.action)
+            yield sse_event("action", {"action": plan_response.action, "parameters": plan_response.parameters})
+            yield sse_event("final", plan_response.model_dump())
+            return
+
+        if plan_cache is not None:
+            cached = plan_cache.get(key)
+            if cached is not None:
+                if request_logger is None:
+                    logger.info(f"plan cache hit, action: {cached['action']}")
+                trace.update(source="cache", action=cached["action"])
+                yield sse_event("action", {"action": cached["action"], "parameters": cached["parameters"]})
+                yield sse_event("final", cached)
+                await finish_switch_task(request, planner_kind, PlanResponse(**cached), trace, PRIORITIES["normal"], None)
+                return
+
+        stream_program = dspy.streamify(
+            planners.get(request.chain, planner_kind),
+            stream_listeners=[
+                StreamListener(signature_field_name="action"),
+                StreamListener(signature_field_name="parameters"),
+            ],
+            is_async_program=True,
         )
+        fields = {"action": "", "parameters": ""}
+        finished = set()
+        action_sent = False
+        prediction = None
+        trace["source"] = "lm"
+        stage_labels.set(labels)
+        lm_start = time.perf_counter()
+        async for value in stream_program(**inputs):
+            if isinstance(value, StreamResponse):
+                fields[value.signature_field_name] += value.chunk
+                if value.is_last_chunk:
+                    finished.add(value.signature_field_name)
+                if not action_sent and finished == {"action", "parameters"}:
+                    partial = parse_streamed_action(fields, catalog, planner_kind)
+                    if partial is not None:
+                        trace["action_ms"] = round((time.perf_counter() - lm_start) * 1000, 1)
+                        yield sse_event("action", partial)
+                        action_sent = True
+            elif isinstance(value, dspy.Prediction):
+                prediction = value
+        # the stream is finished before validating, a repair may call the LM again
+        trace["lm_ms"] = round((time.perf_counter() - lm_start) * 1000, 1)
+        if cascade is not None:
+            cascade.observe_main(planner_kind, time.perf_counter() - lm_start)
+        metrics.observe_usage(prediction.get_lm_usage(), labels)
+        log_plan(planner_kind, prediction)
+        parameters = prediction.parameters
+        if plan_validator is not None:
+            parameters = await asyncio.to_thread(
+                plan_validator.validate, catalog, prediction.action, parameters, request_text(inputs), planner_kind == SWITCH_TASK
+            )
+        convert_start = time.perf_counter()
+        plan_response = format_plan_response(prediction.action, parameters, prediction.action_description)
+        metrics.observe_stage("convert", time.perf_counter() - convert_start, labels)
+        if not action_sent:
+            yield sse_event("action", {"action": plan_response.action, "parameters": plan_response.parameters})
+        yield sse_event("final", plan_response.model_dump())
+        # resolve_switch_task is rejected for streams, this only expects the client's follow-up request
+        await finish_switch_task(request, planner_kind, plan_response, trace, PRIORITIES["normal"], None)
+        if routed is not None:
+            rule, routed_response = routed
+            router.compare(rule, routed_response.action, routed_response.parameters, plan_response)
+        if plan_cache is not None:
+            plan_cache.put(key, plan_response.model_dump())
+        trace["action"] = plan_response.action
+    except Exception as e:
+        status_code, _ = error_status(e)
+        logger.error(f"Error: {e}")
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        finish_request(request_id, "/plan/stream", request, status_code, start, trace)
+
+
+class PlanEventStream(StreamingResponse):
+    """Event stream holding a planner slot, released here so that a client gone before the body started cannot leak it"""
+
+    def __init__(self, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.released = False
 
+    def release(self):
+        if not self.released:
+            self.released = True
+            executor.release()
+            metrics.in_flight.dec("/plan/stream")
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+@app.post("/plan/stream")
+async def plan_stream(
+    request: PlanRequest,
+    http_request: Request,
+    x_request_id: str | None = Header(None),
+    x_tenant_id: str | None = Header(None),
+    x_agent_id: str | None = Header(None),
+    x_priority: str | None = Header(None),
+    x_deadline_ms: str | None = Header(None),
+):
+    """
+    The deadline bounds the wait for a planner slot, a stream that has started runs to completion.
+    resolve_switch_task is rejected: planning `next` would need a second planner slot while the stream holds one.
+    """
+    request_id = x_request_id or uuid.uuid4().hex
+    parsed_at = time.perf_counter()
+    start = http_request.scope.get("received_at", parsed_at)
+    try:
+        if request.resolve_switch_task:
+            raise HTTPException(status_code=422, detail="resolve_switch_task is not supported by /plan/stream, use /plan")
+        admission.admit(tenant(x_tenant_id, x_agent_id))
+        log_request(request_id, request)
+        if request.switched_task:
+            switches.observe_follow_up(switch_key(request), start)
+        planner_kind, catalog, inputs = prepare_plan(request)
+        metrics.observe_stage("parse", parsed_at - start, (request.chain, planner_kind))
+        key = plan_cache_key(request, planner_kind, catalog, inputs) if plan_cache is not None else None
+        queue_start = time.perf_counter()
+        await executor.acquire(admission.classify(x_priority, planner_kind, inputs), admission.deadline(x_deadline_ms, start))
+        metrics.observe_stage("queue", time.perf_counter() - queue_start, (request.chain, planner_kind))
+        metrics.in_flight.inc("/plan/stream")
+    except HTTPException as e:
+        finish_request(request_id, "/plan/stream", request, e.status_code, start, {})
+        raise
+    except PlannerSaturated as e:
+        logger.warning(f"Rejected: {e}")
+        finish_request(request_id, "/plan/stream", request, 503, start, {})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except RateLimited as e:
+        logger.warning(f"Rejected: {e}")
+        finish_request(request_id, "/plan/stream", request, 429, start, {})
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except DeadlineExceeded as e:
+        logger.warning(f"Abandoned: {e}")
+        finish_request(request_id, "/plan/stream", request, 504, start, {})
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error: {e}")
+        finish_request(request_id, "/plan/stream", request, 500, start, {})
         raise HTTPException(status_code=500, detail=str(e))
 
+    return PlanEventStream(
+        stream_plan_events(request, planner_kind, catalog, inputs, key, request_id, start),
+        media_type="text/event-stream",
+        headers={"X-Request-ID": request_id},
+    )
+
+
+@app.post("/catalogs", response_model=CatalogResponse)
+async def register_catalog(request: CatalogRequest):
+    try:
+        catalog = catalogs.register(request.actions)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return CatalogResponse(catalog_id=catalog.id, actions=[action["name"] for action in catalog.actions])
+
+
+@app.get("/catalogs/{catalog_id}")
+async def get_catalog(catalog_id: str):
+    catalog = catalogs.get(catalog_id)
+    if catalog is None:
+        raise HTTPException(status_code=404, detail=f"Unknown catalog_id: {catalog_id}")
+    return {"catalog_id": catalog.id, "actions": catalog.actions}
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if sessions is None or not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session_id: {session_id}")
+    return {"session_id": session_id, "deleted": True}
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    if not ready:
+        raise HTTPException(status_code=503, detail="not ready")
+    return {"status": "ready"}
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "executor": executor.stats(),
+        "admission": admission.stats(),
+        "catalogs": catalogs.stats(),
+        "router": router.stats(),
+        "request_log": request_logger.stats() if request_logger is not None else None,
+        "plan_cache": plan_cache.stats() if plan_cache is not None else None,
+        "coalescing": coalescer.stats() if coalescer is not None else None,
+        "switch_task": switches.stats(),
+        "sessions": sessions.stats() if sessions is not None else None,
+        "lm_pool": lm_pool.stats() if lm_pool is not None else None,
+        "cascade": cascade.stats() if cascade is not None else None,
+        "validation": plan_validator.stats() if plan_validator is not None else None,
+        "prompt_cache": {"layout": prompt_layout, **metrics.prompt_cache_stats()},
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format: stage latencies, LM tokens, actions, errors, in-flight requests and the /stats counters"""
+    return PlainTextResponse(metrics.render(await stats()), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
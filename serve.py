@@ -0,0 +1,119 @@
+"""
+Production serving: one listening socket shared by pre-forked uvicorn workers.
+
+    python serve.py --host 0.0.0.0 --port 8080 --workers 4
+
+dspy, litellm and the planner programs are loaded once in the parent before forking, so workers start serving
+right away and share those pages. Anything holding threads or connections (the LM HTTP clients, the executor
+thread pool, the request log writer, the plan cache sqlite connection) is created in each worker.
+On SIGTERM or SIGINT every worker stops reporting ready, stops accepting connections and lets in-flight
+LM calls finish (up to --graceful-timeout seconds) before exiting.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+from loguru import logger
+
+import main
+
+
+def default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that reports not ready as soon as it is asked to exit"""
+
+    def handle_exit(self, sig, frame):
+        main.ready = False
+        super().handle_exit(sig, frame)
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(
+        main.app,
+        log_level="info",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+    )
+    DrainingServer(config).run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            run_worker(sock, args)
+            code = 0
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(args):
+    started = time.perf_counter()
+    main.warm_up()
+    sock = bind(args.host, args.port)
+    logger.info(f"pre-fork initialization took {time.perf_counter() - started:.2f}s, starting {args.workers} workers")
+
+    workers = {spawn(sock, args) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(sig, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(1)
+            workers.add(spawn(sock, args))
+    sock.close()
+    logger.info("all workers stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", default_workers())))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "60")),
+                        help="Seconds a draining worker waits for in-flight requests")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Seconds an idle keep-alive connection is kept open")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        raise SystemExit("serve.py needs fork, run `python main.py` on Windows")
+    serve(args)